@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2010-2013 Reality <tinmachin3@gmail.com> and Psychedelic Squid <psquid@psquid.net>
+# 
+# This program is free software: you can redistribute it and/or modify 
+# it under the terms of the GNU General Public License as published by 
+# the Free Software Foundation, either version 3 of the License, or 
+# (at your option) any later version. 
+# 
+# This program is distributed in the hope that it will be useful, 
+# but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the 
+# GNU General Public License for more details. 
+# 
+# You should have received a copy of the GNU General Public License 
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmark of created_at parsing: setlocale, a regex and strptime for
+every call (how times used to be parsed) versus the locale-free parser.
+Notices are only parsed once, when they come in, and keep the result as
+ic__epoch.
+
+Usage: python bench/created_at_parsing.py [iterations]
+"""
+
+import os, sys, timeit, datetime, locale, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "identicurse"))
+
+import helpers
+
+def strptime_datetime(timestring):
+    locale.setlocale(locale.LC_TIME, 'C')
+    datetime_no_offset = helpers.offset_regex.sub("+0000", timestring)
+    attempts = 10
+    while attempts > 0:
+        attempts -= 1
+        try:
+            normalised_datetime = datetime.datetime.strptime(datetime_no_offset, helpers.DATETIME_FORMAT) + helpers.utc_offset(timestring)
+            break
+        except ValueError:
+            pass
+    locale.setlocale(locale.LC_TIME, '')
+    return normalised_datetime
+
+random.seed(0)
+now = datetime.datetime(2013, 5, 1, 12, 0, 0)
+timestrings = [(now - datetime.timedelta(seconds=random.randint(0, 60 * 60 * 24 * 30))).strftime("%a %b %d %H:%M:%S +0000 %Y") for i in xrange(200)]
+
+def parse_all(parse):
+    for timestring in timestrings:
+        parse(timestring)
+
+if __name__ == "__main__":
+    for timestring in timestrings:
+        assert helpers.normalise_datetime(timestring) == strptime_datetime(timestring), timestring
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print "%d time strings per run" % (len(timestrings))
+    before_time = min(timeit.repeat(lambda: parse_all(strptime_datetime), number=iterations, repeat=3)) / iterations * 1e6
+    after_time = min(timeit.repeat(lambda: parse_all(helpers.normalise_datetime), number=iterations, repeat=3)) / iterations * 1e6
+    print "%14s %14s %8s" % ("before (us)", "after (us)", "speedup")
+    print "%14.1f %14.1f %7.1fx" % (before_time, after_time, before_time / after_time)
@@ -0,0 +1,784 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2010-2013 Reality <tinmachin3@gmail.com> and Psychedelic Squid <psquid@psquid.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A local stand-in for a StatusNet/GNU social instance, so the client can be
+load tested offline and repeatably. It either serves a synthetic site (seeded
+timelines of a chosen size that grow at a chosen rate), records a session
+against a real instance to a fixture file, or replays such a file. Latency,
+errors and rate limiting can be added in every mode.
+
+Usage: python bench/fake_statusnet.py [options]
+       python bench/fake_statusnet.py --record FILE --upstream https://example.net/api
+       python bench/fake_statusnet.py --replay FILE
+
+Then use http://127.0.0.1:PORT/api as the API path, with basic auth and any
+username and password. Recording only works with basic auth, since an OAuth
+signature covers the host it was made for.
+
+Other benchmarks can run one in-process with start(SyntheticSite(...)).
+"""
+
+import os, re, json, time, random, threading, bisect, urlparse, httplib, zlib, hashlib, collections
+import BaseHTTPServer, SocketServer
+from optparse import OptionParser
+
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+WORDS = ("the a of to and in is it you that he was for on are with as his they be at one have this from or had by hot "
+         "word but what some we can out other were all there when up use your how said an each she which do their time "
+         "if will way about many then them write would like so these her long make thing see him two has look more day "
+         "could go come did number sound no most people my over know water than call first who may down side been now "
+         "find federation notice dent group free software curses terminal server").split()
+SOURCES = ["web", "IdentiCurse", "api", "xmpp", "ostatus", "mobile"]
+
+Request = collections.namedtuple("Request", "method endpoint params query body headers")
+
+
+def format_datetime(timestamp):
+    """ The API's created_at format, written out by hand so the locale can't change it. """
+    t = time.gmtime(timestamp)
+    return "%s %s %02d %02d:%02d:%02d +0000 %d" % (DAYS[t.tm_wday], MONTHS[t.tm_mon - 1], t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, t.tm_year)
+
+
+def error_body(message):
+    return json.dumps({"error": message})
+
+
+def trimmed(notice):
+    """ A copy of notice with its user (and any repeated notice's user) cut down to the id, as trim_user asks for. """
+    if not isinstance(notice, dict) or not "user" in notice:
+        return notice
+    notice = dict(notice, user={"id": notice["user"]["id"]})
+    if "retweeted_status" in notice:
+        notice["retweeted_status"] = trimmed(notice["retweeted_status"])
+    return notice
+
+
+class SyntheticSite(object):
+    """ A made-up instance: users, groups, notices and direct messages, all generated from a seed so every run sees the same site. New notices arrive at churn per second. """
+    def __init__(self, notices=500, users=50, groups=10, churn=0.0, seed=0, nickname="demo", trim_users=True):
+        self.random = random.Random(seed)
+        self.trim_users = trim_users  # whether to honour trim_user, as some real servers don't
+        self.lock = threading.RLock()
+        self.churn = churn
+        self.started = time.time()
+        self.churned = 0
+        self.next_id = 1
+        self.notices = {}
+        self.indices = {}  # index key -> ascending notice ids, e.g. ("user", 3) or ("tag", "free")
+        self.deleted = set()
+        self.directs = []
+        self.favourites = []
+        self.blocked = set()
+
+        self.users = [self.__user(n + 1, n == 0 and nickname or "user%d" % (n)) for n in xrange(max(users, 1))]
+        self.me = self.users[0]
+        self.users_by_name = dict((user["screen_name"].lower(), user) for user in self.users)
+        self.following = set(user["id"] for user in self.random.sample(self.users[1:], len(self.users[1:]) // 2))
+        self.followers = set(user["id"] for user in self.random.sample(self.users[1:], len(self.users[1:]) // 2))
+        for user in self.users[1:]:
+            user["following"] = user["id"] in self.following
+        self.me["friends_count"] = len(self.following)
+        self.me["followers_count"] = len(self.followers)
+
+        self.groups = [self.__group(n + 1, "group%d" % (n)) for n in xrange(max(groups, 1))]
+        self.groups_by_name = dict((group["nickname"], group) for group in self.groups)
+        self.memberships = set(group["id"] for group in self.groups[::2])
+        for group in self.groups:
+            group["member"] = group["id"] in self.memberships
+
+        backdate = self.started - notices * 30  # the initial notices are spread over the time before startup
+        for n in xrange(notices):
+            self.add_notice(created=backdate + n * 30)
+        for n in xrange(notices // 20):
+            self.add_direct(created=backdate + n * 600)
+
+    def __user(self, id, screen_name):
+        return {"id": id, "screen_name": screen_name, "name": screen_name.capitalize(), "location": self.random.choice(["", "Earth", "The Internet"]),
+                "description": " ".join(self.random.sample(WORDS, 8)), "url": "", "protected": False,
+                "profile_image_url": "http://127.0.0.1/avatar/%d-48.png" % (id), "statusnet_profile_url": "http://127.0.0.1/%s" % (screen_name),
+                "created_at": format_datetime(self.started - 86400 * 365), "followers_count": 0, "friends_count": 0, "statuses_count": 0,
+                "favourites_count": 0, "following": False, "notifications": False, "utc_offset": "0", "time_zone": "UTC"}
+
+    def __group(self, id, nickname):
+        return {"id": id, "nickname": nickname, "fullname": nickname.capitalize(), "url": "http://127.0.0.1/group/%s" % (nickname),
+                "homepage": "", "location": "", "description": " ".join(self.random.sample(WORDS, 6)), "member_count": self.random.randint(1, 200),
+                "admin_count": 1, "created": format_datetime(self.started - 86400 * 100), "modified": format_datetime(self.started - 86400),
+                "member": False, "blocked": False, "original_logo": "", "homepage_logo": "", "stream_logo": "", "mini_logo": ""}
+
+    def __index(self, key, id):
+        self.indices.setdefault(key, []).append(id)
+
+    def add_notice(self, user=None, text=None, in_reply_to=None, repeat_of=None, source=None, created=None):
+        """ Adds a notice, made up wherever an argument is left out, and returns it. """
+        with self.lock:
+            random = self.random
+            if user is None:
+                user = random.choice(self.users)
+            if text is None and repeat_of is None:
+                if in_reply_to is None and len(self.notices) > 0 and random.random() < 0.15:
+                    in_reply_to = self.notices[random.randint(1, self.next_id - 1)]
+                words = random.sample(WORDS, random.randint(5, 20))
+                if random.random() < 0.1:
+                    words.insert(random.randint(0, len(words)), "@" + self.me["screen_name"])
+                if random.random() < 0.2:
+                    words.insert(random.randint(0, len(words)), "@" + random.choice(self.users)["screen_name"])
+                if random.random() < 0.15:
+                    words.insert(random.randint(0, len(words)), "!" + random.choice(self.groups)["nickname"])
+                if random.random() < 0.15:
+                    words.insert(random.randint(0, len(words)), "#" + random.choice(WORDS))
+                if in_reply_to is not None:
+                    words.insert(0, "@" + in_reply_to["user"]["screen_name"])
+                text = " ".join(words)
+            elif repeat_of is not None:
+                text = "RT @%s %s" % (repeat_of["user"]["screen_name"], repeat_of["text"])
+
+            id = self.next_id
+            self.next_id += 1
+            notice = {"id": id, "text": text, "statusnet_html": text, "truncated": False,
+                      "created_at": format_datetime(created or time.time()), "source": source or random.choice(SOURCES),
+                      "in_reply_to_status_id": None, "in_reply_to_user_id": None, "in_reply_to_screen_name": None,
+                      "statusnet_conversation_id": id, "favorited": False, "repeated": False, "attachments": [], "user": user}
+            if in_reply_to is not None:
+                notice["in_reply_to_status_id"] = in_reply_to["id"]
+                notice["in_reply_to_user_id"] = in_reply_to["user"]["id"]
+                notice["in_reply_to_screen_name"] = in_reply_to["user"]["screen_name"]
+                notice["statusnet_conversation_id"] = in_reply_to["statusnet_conversation_id"]
+            if repeat_of is not None:
+                notice["retweeted_status"] = repeat_of
+                self.__index(("repeats_of", repeat_of["user"]["id"]), id)
+            self.notices[id] = notice
+            user["statuses_count"] += 1
+
+            self.__index(("public",), id)
+            self.__index(("user", user["id"]), id)
+            self.__index(("conversation", notice["statusnet_conversation_id"]), id)
+            if user is self.me or user["id"] in self.following:
+                self.__index(("home",), id)
+            for mention in re.findall(r"([@!#])([\w.-]+)", text):
+                if mention[0] == "@":
+                    self.__index(("mention", mention[1].lower()), id)
+                elif mention[0] == "!":
+                    self.__index(("group", mention[1].lower()), id)
+                else:
+                    self.__index(("tag", mention[1].lower()), id)
+            return notice
+
+    def add_direct(self, sender=None, recipient=None, text=None, created=None):
+        with self.lock:
+            if sender is None and recipient is None:
+                other = self.random.choice(self.users[1:] or self.users)
+                sender, recipient = self.random.choice([(other, self.me), (self.me, other)])
+            if text is None:
+                text = " ".join(self.random.sample(WORDS, self.random.randint(3, 12)))
+            direct = {"id": len(self.directs) + 1, "text": text, "sender": sender, "recipient": recipient,
+                      "sender_id": sender["id"], "recipient_id": recipient["id"],
+                      "sender_screen_name": sender["screen_name"], "recipient_screen_name": recipient["screen_name"],
+                      "created_at": format_datetime(created or time.time())}
+            self.directs.append(direct)
+            return direct
+
+    def catch_up(self):
+        """ Adds whatever notices churn says should have arrived since startup. """
+        if self.churn <= 0:
+            return
+        with self.lock:
+            due = int((time.time() - self.started) * self.churn) - self.churned
+            for n in xrange(due):
+                self.add_notice()
+                if self.random.random() < 0.05:
+                    self.add_direct()
+            self.churned += max(due, 0)
+
+    def __rebuild_home(self):
+        self.indices[("home",)] = [id for id in self.indices.get(("public",), []) if self.notices[id]["user"] is self.me or self.notices[id]["user"]["id"] in self.following]
+
+    def __page(self, ids, params, default_count=20):
+        """ The notices out of ids (ascending) that a timeline request's since_id, max_id, count and page select, newest first. """
+        since_id, max_id = int(params.get("since_id", 0)), int(params.get("max_id", 0))
+        count = min(int(params.get("count", params.get("rpp", default_count))), 200)
+        skip = (max(int(params.get("page", 1)), 1) - 1) * count
+        start = bisect.bisect_right(ids, since_id)
+        end = max_id and bisect.bisect_right(ids, max_id) or len(ids)
+        page = []
+        for position in xrange(end - 1, start - 1, -1):
+            if ids[position] in self.deleted:
+                continue
+            if skip > 0:
+                skip -= 1
+                continue
+            page.append(self.notices[ids[position]])
+            if len(page) >= count:
+                break
+        return page
+
+    def __cursored(self, items, key, params, page_size):
+        cursor = int(params.get("cursor", 0))
+        if cursor == 0:  # no cursor asked for, so the old plain list
+            return items[:page_size]
+        start = max(cursor, 0)  # -1 is the first page; after that, the cursor is the offset of the page
+        end = start + page_size
+        return {key: items[start:end], "next_cursor": end < len(items) and end or 0, "previous_cursor": start > 0 and -start or 0}
+
+    def __find_user(self, params, default=None):  # a user_id of 0 or an empty screen_name counts as not given, as the client sends them
+        for key in ["user_id", "id"]:
+            if params.get(key, "").isdigit() and int(params[key]) != 0:
+                return self.users[int(params[key]) - 1] if int(params[key]) <= len(self.users) else None
+        name = params.get("screen_name", "") or params.get("id", "")
+        if name != "" and not name.isdigit():
+            return self.users_by_name.get(name.lower())
+        return default
+
+    def __find_group(self, name_or_id, params):
+        name_or_id = name_or_id or params.get("id", params.get("nickname", ""))
+        if name_or_id.isdigit():
+            return self.groups[int(name_or_id) - 1] if 0 < int(name_or_id) <= len(self.groups) else None
+        return self.groups_by_name.get(name_or_id.lower())
+
+    def respond(self, request):
+        """ (status, body, extra headers) for request. """
+        self.catch_up()
+        with self.lock:
+            for pattern, handler in self.routes:
+                match = re.match(pattern + "$", request.endpoint)
+                if match:
+                    try:
+                        result = handler(self, request.params, *match.groups())
+                    except (ValueError, KeyError, IndexError), e:
+                        return 400, error_body("Bad request: %s" % (e)), {}
+                    if isinstance(result, tuple):
+                        return result[0], error_body(result[1]), {}
+                    if self.trim_users and request.params.get("trim_user", "").lower() in ["true", "t", "1"] and isinstance(result, list):
+                        result = [trimmed(notice) for notice in result]
+                    return 200, json.dumps(result), {}
+        return 404, error_body("API method not found."), {}
+
+    def help_test(self, params):
+        return "ok"
+
+    def verify_credentials(self, params):
+        return self.me
+
+    def rate_limit_status(self, params):
+        return {"remaining_hits": 150, "hourly_limit": 150, "reset_time_in_seconds": int(time.time()) + 3600, "reset_time": format_datetime(time.time() + 3600)}
+
+    def config(self, params):
+        return {"site": {"name": "Fake StatusNet", "server": "127.0.0.1", "path": "", "textlimit": "140", "timezone": "UTC", "closed": "0", "inviteonly": "0", "private": "0", "ssl": "never"},
+                "license": {"url": "", "title": "", "image": ""}, "attachments": {"uploads": False, "file_quota": 0},
+                "group": {"desclimit": "140"}, "notice": {"contentlimit": "140"}, "profile": {"biolimit": "140"}}
+
+    def version(self, params):
+        return "1.1.0-fake"
+
+    def home_timeline(self, params):
+        return self.__page(self.indices.get(("home",), []), params)
+
+    def public_timeline(self, params):
+        return self.__page(self.indices.get(("public",), []), params)
+
+    def mentions(self, params):
+        return self.__page(self.indices.get(("mention", self.me["screen_name"].lower()), []), params)
+
+    def user_timeline(self, params):
+        user = self.__find_user(params, self.me)
+        if user is None:
+            return 404, "User not found."
+        return self.__page(self.indices.get(("user", user["id"]), []), params)
+
+    def retweets_of_me(self, params):
+        return self.__page(self.indices.get(("repeats_of", self.me["id"]), []), params)
+
+    def group_timeline(self, params, name_or_id):
+        group = self.__find_group(name_or_id, params)
+        if group is None:
+            return 404, "Group not found."
+        return self.__page(self.indices.get(("group", group["nickname"]), []), params)
+
+    def tag_timeline(self, params, tag):
+        return self.__page(self.indices.get(("tag", tag.lower()), []), params)
+
+    def conversation(self, params, id):
+        return self.__page(self.indices.get(("conversation", int(id)), []), params)
+
+    def favorites(self, params):
+        return self.__page(self.favourites, params)
+
+    def show(self, params, id=None):
+        id = int(id or params["id"])
+        if not id in self.notices or id in self.deleted:
+            return 404, "No status found with that ID."
+        return self.notices[id]
+
+    def update(self, params):
+        in_reply_to = None
+        if int(params.get("in_reply_to_status_id", 0)) in self.notices:
+            in_reply_to = self.notices[int(params["in_reply_to_status_id"])]
+        return self.add_notice(self.me, params["status"], in_reply_to, source=params.get("source", "api"))
+
+    def destroy(self, params, id=None):
+        notice = self.show(params, id)
+        if isinstance(notice, dict):
+            self.deleted.add(notice["id"])
+        return notice
+
+    def retweet(self, params, id):
+        original = self.show(params, id)
+        if not isinstance(original, dict):
+            return original
+        original["repeated"] = True
+        return self.add_notice(self.me, repeat_of=original, source=params.get("source", "api"))
+
+    def favorite(self, params, action, id):
+        notice = self.show(params, id)
+        if not isinstance(notice, dict):
+            return notice
+        if action == "create" and not notice["favorited"]:
+            bisect.insort(self.favourites, notice["id"])
+        elif action == "destroy" and notice["favorited"]:
+            self.favourites.remove(notice["id"])
+        notice["favorited"] = action == "create"
+        self.me["favourites_count"] = len(self.favourites)
+        return notice
+
+    def users_show(self, params):
+        user = self.__find_user(params, self.me)
+        if user is None:
+            return 404, "User not found."
+        return user
+
+    def __friend_ids(self, user):
+        if user is self.me:
+            return sorted(self.following)
+        return [other["id"] for other in self.users if other is not user][:user["id"] * 3]  # anyone else's are made up, but stable
+
+    def __follower_ids(self, user):
+        if user is self.me:
+            return sorted(self.followers)
+        return [other["id"] for other in self.users if other is not user][:user["id"] * 2]
+
+    def statuses_friends(self, params):
+        user = self.__find_user(params, self.me)
+        if user is None:
+            return 404, "User not found."
+        return self.__cursored([self.users[id - 1] for id in self.__friend_ids(user)], "users", params, 100)
+
+    def statuses_followers(self, params):
+        user = self.__find_user(params, self.me)
+        if user is None:
+            return 404, "User not found."
+        return self.__cursored([self.users[id - 1] for id in self.__follower_ids(user)], "users", params, 100)
+
+    def friends_ids(self, params):
+        user = self.__find_user(params, self.me)
+        if user is None:
+            return 404, "User not found."
+        return self.__cursored(self.__friend_ids(user), "ids", params, 5000)
+
+    def followers_ids(self, params):
+        user = self.__find_user(params, self.me)
+        if user is None:
+            return 404, "User not found."
+        return self.__cursored(self.__follower_ids(user), "ids", params, 5000)
+
+    def friendship(self, params, action):
+        user = self.__find_user(params)
+        if user is None:
+            return 404, "User not found."
+        if action == "create":
+            self.following.add(user["id"])
+        else:
+            self.following.discard(user["id"])
+        user["following"] = action == "create"
+        self.me["friends_count"] = len(self.following)
+        self.__rebuild_home()
+        return user
+
+    def friendship_exists(self, params):
+        user_a, user_b = self.__find_user({"id": params["user_a"]}), self.__find_user({"id": params["user_b"]})
+        if user_a is self.me and user_b is not None:
+            return user_b["id"] in self.following
+        if user_b is self.me and user_a is not None:
+            return user_a["id"] in self.followers
+        return False
+
+    def friendship_show(self, params):
+        source = self.__find_user({"id": params.get("source_id", params.get("source_screen_name", ""))}, self.me) or self.me
+        target = self.__find_user({"id": params.get("target_id", params.get("target_screen_name", ""))})
+        if target is None:
+            return 404, "User not found."
+        following = source is self.me and target["id"] in self.following
+        followed_by = source is self.me and target["id"] in self.followers
+        return {"relationship": {"source": {"id": source["id"], "screen_name": source["screen_name"], "following": following, "followed_by": followed_by, "blocking": target["id"] in self.blocked, "notifications_enabled": False},
+                                 "target": {"id": target["id"], "screen_name": target["screen_name"], "following": followed_by, "followed_by": following}}}
+
+    def block(self, params, action):
+        user = self.__find_user(params)
+        if user is None:
+            return 404, "User not found."
+        if action == "create":
+            self.blocked.add(user["id"])
+        else:
+            self.blocked.discard(user["id"])
+        return user
+
+    def direct_messages(self, params):
+        return self.__directs([direct for direct in self.directs if direct["recipient"] is self.me], params)
+
+    def direct_messages_sent(self, params):
+        return self.__directs([direct for direct in self.directs if direct["sender"] is self.me], params)
+
+    def __directs(self, directs, params):
+        since_id, max_id = int(params.get("since_id", 0)), int(params.get("max_id", 0))
+        count = min(int(params.get("count", 20)), 200)
+        skip = (max(int(params.get("page", 1)), 1) - 1) * count
+        directs = [direct for direct in reversed(directs) if direct["id"] > since_id and (max_id == 0 or direct["id"] <= max_id)]
+        return directs[skip:skip + count]
+
+    def direct_messages_new(self, params):
+        recipient = self.__find_user(params)
+        if recipient is None:
+            return 404, "User not found."
+        return self.add_direct(self.me, recipient, params["text"])
+
+    def group_show(self, params, name_or_id):
+        group = self.__find_group(name_or_id, params)
+        if group is None:
+            return 404, "Group not found."
+        return group
+
+    def group_membership_change(self, params, action, name_or_id):
+        group = self.__find_group(name_or_id, params)
+        if group is None:
+            return 404, "Group not found."
+        if action == "join":
+            self.memberships.add(group["id"])
+        else:
+            self.memberships.discard(group["id"])
+        group["member"] = action == "join"
+        return group
+
+    def group_list(self, params):
+        user = self.__find_user(params, self.me)
+        if user is self.me:
+            return [group for group in self.groups if group["id"] in self.memberships]
+        return self.groups[user["id"] % len(self.groups)::len(self.groups) // 2 or 1]
+
+    def group_list_all(self, params):
+        return self.groups[:int(params.get("count", len(self.groups)))]
+
+    def group_membership(self, params, name_or_id):
+        group = self.__find_group(name_or_id, params)
+        if group is None:
+            return 404, "Group not found."
+        return [user for user in self.users if (user["id"] + group["id"]) % 3 == 0 or (user is self.me and group["id"] in self.memberships)]
+
+    def group_is_member(self, params):
+        return {"is_member": int(params["user_id"]) == self.me["id"] and int(params["group_id"]) in self.memberships}
+
+    def search(self, params):
+        query = params.get("q", "").lower()
+        matches = [id for id in self.indices.get(("public",), []) if query in self.notices[id]["text"].lower()]
+        page = self.__page(matches, params, 15)
+        return {"query": params.get("q", ""), "results": [{"id": notice["id"], "text": notice["text"], "from_user": notice["user"]["screen_name"],
+                "from_user_id": notice["user"]["id"], "created_at": notice["created_at"], "source": notice["source"],
+                "profile_image_url": notice["user"]["profile_image_url"]} for notice in page], "since_id": int(params.get("since_id", 0)),
+                "max_id": page and page[0]["id"] or 0, "results_per_page": len(page), "page": int(params.get("page", 1))}
+
+    routes = [
+        ("help/test", help_test),
+        ("account/verify_credentials", verify_credentials),
+        ("account/rate_limit_status", rate_limit_status),
+        ("statusnet/config", config),
+        ("statusnet/version", version),
+        ("statuses/(?:home|friends)_timeline", home_timeline),
+        ("statuses/public_timeline", public_timeline),
+        ("statuses/(?:mentions|replies)", mentions),
+        ("statuses/user_timeline", user_timeline),
+        ("statuses/retweets_of_me", retweets_of_me),
+        ("statuses/show(?:/(\d+))?", show),
+        ("statuses/update", update),
+        ("statuses/destroy(?:/(\d+))?", destroy),
+        ("statuses/retweet/(\d+)", retweet),
+        ("statuses/friends", statuses_friends),
+        ("statuses/followers", statuses_followers),
+        ("friends/ids", friends_ids),
+        ("followers/ids", followers_ids),
+        ("users/show", users_show),
+        ("favorites", favorites),
+        ("favorites/(create|destroy)/(\d+)", favorite),
+        ("friendships/(create|destroy)", friendship),
+        ("friendships/exists", friendship_exists),
+        ("friendships/show", friendship_show),
+        ("blocks/(create|destroy)", block),
+        ("direct_messages", direct_messages),
+        ("direct_messages/sent", direct_messages_sent),
+        ("direct_messages/new", direct_messages_new),
+        ("statusnet/groups/show(?:/([^/]+))?", group_show),
+        ("statusnet/groups/(join|leave)(?:/([^/]+))?", group_membership_change),
+        ("statusnet/groups/timeline(?:/([^/]+))?", group_timeline),
+        ("statusnet/groups/membership(?:/([^/]+))?", group_membership),
+        ("statusnet/groups/list", group_list),
+        ("statusnet/groups/list_all", group_list_all),
+        ("statusnet/groups/is_member", group_is_member),
+        ("statusnet/tags/timeline/([^/]+)", tag_timeline),
+        ("statusnet/conversation/(\d+)", conversation),
+        ("search", search),
+    ]
+
+
+def fixture_key(method, endpoint, params):
+    return (method, endpoint, tuple(sorted((key, value) for (key, value) in params.items() if not key.startswith("oauth_"))))
+
+
+class Recorder(object):
+    """ Passes every request through to a real instance, keeping each exchange so save() can write them out as a fixture file for Replayer. """
+    kept_headers = ["content-type", "retry-after", "x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset"]
+
+    def __init__(self, upstream):
+        parts = urlparse.urlsplit(upstream)
+        self.upstream = upstream
+        self.secure = parts.scheme == "https"
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.exchanges = []
+        self.lock = threading.Lock()
+
+    def respond(self, request):
+        headers = dict((key, value) for (key, value) in request.headers.items() if key.lower() in ["authorization", "content-type", "user-agent"])
+        uri = "%s/%s.json" % (self.prefix, request.endpoint)
+        if request.query:
+            uri = "%s?%s" % (uri, request.query)
+        if self.secure:
+            connection = httplib.HTTPSConnection(self.host, timeout=60)
+        else:
+            connection = httplib.HTTPConnection(self.host, timeout=60)
+        try:
+            connection.request(request.method, uri, request.body, headers)  # no Accept-Encoding, so the fixture holds plain bodies
+            response = connection.getresponse()
+            body = response.read()
+        finally:
+            connection.close()
+        extra_headers = dict((key, response.getheader(key)) for key in self.kept_headers if response.getheader(key) is not None and key != "content-type")
+        with self.lock:
+            self.exchanges.append({"method": request.method, "endpoint": request.endpoint, "params": request.params, "status": response.status,
+                                   "headers": extra_headers, "body": body.decode("utf-8", "replace")})
+        return response.status, body, extra_headers
+
+    def save(self, path):
+        with self.lock:
+            fixture = {"upstream": self.upstream, "recorded_at": int(time.time()), "exchanges": self.exchanges}
+        with open(path + ".tmp", "w") as fixture_file:
+            json.dump(fixture, fixture_file, indent=1)
+        os.rename(path + ".tmp", path)  # so an interrupted save can't leave a half-written fixture
+
+
+class Replayer(object):
+    """ Serves the exchanges from a Recorder fixture. Repeats of a request get the recorded responses in order, then the last one again. A request that was never recorded gets the next recording of its endpoint with any parameters, or a 404. """
+    def __init__(self, path):
+        with open(path) as fixture_file:
+            fixture = json.load(fixture_file)
+        self.exact = {}
+        self.loose = {}
+        for exchange in fixture["exchanges"]:
+            self.exact.setdefault(fixture_key(exchange["method"], exchange["endpoint"], exchange["params"]), []).append(exchange)
+            self.loose.setdefault((exchange["method"], exchange["endpoint"]), []).append(exchange)
+        self.served = {}
+        self.lock = threading.Lock()
+
+    def __next(self, table, key):
+        exchanges = table[key]
+        position = self.served.get(key, 0)
+        self.served[key] = position + 1
+        return exchanges[min(position, len(exchanges) - 1)]
+
+    def respond(self, request):
+        with self.lock:
+            key = fixture_key(request.method, request.endpoint, request.params)
+            if key in self.exact:
+                exchange = self.__next(self.exact, key)
+            elif (request.method, request.endpoint) in self.loose:
+                exchange = self.__next(self.loose, (request.method, request.endpoint))
+            else:
+                return 404, error_body("Not in the fixture: %s %s" % (request.method, request.endpoint)), {}
+        return exchange["status"], exchange["body"].encode("utf-8"), dict(exchange["headers"])
+
+
+class FakeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as real instances and the client's connection pool expect
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        server = self.server
+        path, _, query = self.path.partition("?")
+        body = None
+        if self.command == "POST":
+            body = self.rfile.read(int(self.headers.get("content-length", 0)))
+        params = dict(urlparse.parse_qsl(query))
+        if body:
+            params.update(urlparse.parse_qsl(body))
+
+        if not path.startswith(server.prefix + "/"):
+            return self.send(404, error_body("Not an API path."))
+        endpoint = re.sub(r"\.json$", "", path[len(server.prefix) + 1:])
+
+        delay = server.latency
+        if server.jitter > 0:
+            delay += server.random.uniform(0, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if server.error_rate > 0 and server.random.random() < server.error_rate:
+            headers = {}
+            if server.retry_after is not None:
+                headers["Retry-After"] = str(server.retry_after)
+            return self.send(server.error_code, error_body("Injected failure."), headers)
+        limit_headers = server.take_hit()
+        if limit_headers is None:
+            return self.send(400, error_body("Rate limit exceeded."), server.limit_headers())
+
+        status, body, headers = server.backend.respond(Request(self.command, endpoint, params, query, body, self.headers))
+        headers.update(limit_headers)
+        self.send(status, body, headers)
+
+    do_POST = do_GET
+
+    def send(self, status, body, headers={}):
+        headers = dict(headers)
+        if status == 200:
+            etag = '"%s"' % (hashlib.md5(body).hexdigest())
+            headers["ETag"] = etag
+            if self.headers.get("if-none-match") == etag:
+                status, body = 304, ""
+        if len(body) > 256 and self.server.gzip and "gzip" in self.headers.get("accept-encoding", ""):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+            body = compressor.compress(body) + compressor.flush()
+            headers["Content-Encoding"] = "gzip"
+        self.send_response(status)
+        if status != 304:
+            headers.setdefault("Content-Type", "application/json; charset=utf-8")
+        headers["Content-Length"] = str(len(body))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """ Serves a backend (SyntheticSite, Recorder or Replayer) under prefix, adding the requested latency, errors and rate limit on the way. """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, backend, prefix="/api", latency=0.0, jitter=0.0, error_rate=0.0, error_code=503, retry_after=None, gzip=True, rate_limit=0, seed=0, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, FakeHandler)
+        self.backend = backend
+        self.prefix = prefix.rstrip("/")
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.retry_after = retry_after
+        self.gzip = gzip
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.verbose = verbose
+        self.remaining = rate_limit
+        self.reset_at = time.time() + 3600
+        self.lock = threading.Lock()
+
+    def limit_headers(self):
+        if self.rate_limit <= 0:
+            return {}
+        return {"X-RateLimit-Limit": str(self.rate_limit), "X-RateLimit-Remaining": str(self.remaining), "X-RateLimit-Reset": str(int(self.reset_at))}
+
+    def take_hit(self):
+        """ The rate limit headers for one more request, or None if the limit is used up. """
+        if self.rate_limit <= 0:
+            return {}
+        with self.lock:
+            if time.time() >= self.reset_at:
+                self.remaining = self.rate_limit
+                self.reset_at = time.time() + 3600
+            if self.remaining <= 0:
+                return None
+            self.remaining -= 1
+            return self.limit_headers()
+
+    def api_path(self):
+        return "http://%s:%d%s" % (self.server_address[0], self.server_address[1], self.prefix)
+
+
+def start(backend, host="127.0.0.1", port=0, **settings):
+    """ Serves backend from a background thread, returning the server and the API path to give the client. """
+    server = FakeServer((host, port), backend, **settings)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, server.api_path()
+
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("--host", default="127.0.0.1", help="address to listen on [%default]")
+    parser.add_option("--port", type="int", default=8080, help="port to listen on [%default]")
+    parser.add_option("--prefix", default="/api", help="path the API is served under [%default]")
+    parser.add_option("--notices", type="int", default=500, help="notices on the synthetic site at startup [%default]")
+    parser.add_option("--users", type="int", default=50, help="users on the synthetic site [%default]")
+    parser.add_option("--groups", type="int", default=10, help="groups on the synthetic site [%default]")
+    parser.add_option("--churn", type="float", default=0.5, help="new notices per second on the synthetic site [%default]")
+    parser.add_option("--nickname", default="demo", help="the synthetic site's logged-in user, whatever the credentials [%default]")
+    parser.add_option("--no-trim-user", action="store_false", dest="trim_users", default=True, help="ignore trim_user, like servers that don't support it")
+    parser.add_option("--seed", type="int", default=0, help="seed for the synthetic site and injected failures [%default]")
+    parser.add_option("--latency", type="float", default=0.0, help="seconds added to every response [%default]")
+    parser.add_option("--jitter", type="float", default=0.0, help="up to this many more seconds, at random [%default]")
+    parser.add_option("--error-rate", type="float", default=0.0, help="fraction of requests to fail [%default]")
+    parser.add_option("--error-code", type="int", default=503, help="status of failed requests [%default]")
+    parser.add_option("--retry-after", type="int", help="Retry-After to send with failed requests")
+    parser.add_option("--rate-limit", type="int", default=0, help="requests allowed per hour, with X-RateLimit headers; 0 for none [%default]")
+    parser.add_option("--no-gzip", action="store_false", dest="gzip", default=True, help="never compress responses")
+    parser.add_option("--record", metavar="FILE", help="pass requests through to --upstream, saving them to FILE on exit")
+    parser.add_option("--upstream", metavar="API_PATH", help="the real instance to record, e.g. https://example.net/api")
+    parser.add_option("--replay", metavar="FILE", help="serve the exchanges recorded in FILE")
+    parser.add_option("-v", "--verbose", action="store_true", default=False, help="log every request")
+    options = parser.parse_args()[0]
+
+    if options.record is not None:
+        if options.upstream is None:
+            parser.error("--record needs --upstream")
+        backend = Recorder(options.upstream)
+    elif options.replay is not None:
+        backend = Replayer(options.replay)
+    else:
+        backend = SyntheticSite(options.notices, options.users, options.groups, options.churn, options.seed, options.nickname, options.trim_users)
+
+    server = FakeServer((options.host, options.port), backend, options.prefix, options.latency, options.jitter, options.error_rate,
+                        options.error_code, options.retry_after, options.gzip, options.rate_limit, options.seed, options.verbose)
+    print "Serving on %s (Ctrl-C to stop)" % (server.api_path())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if options.record is not None:
+            backend.save(options.record)
+            print "Saved %d exchanges to %s" % (len(backend.exchanges), options.record)
+
+if __name__ == "__main__":
+    main()
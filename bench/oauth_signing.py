@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2010-2013 Reality <tinmachin3@gmail.com> and Psychedelic Squid <psquid@psquid.net>
+# 
+# This program is free software: you can redistribute it and/or modify 
+# it under the terms of the GNU General Public License as published by 
+# the Free Software Foundation, either version 3 of the License, or 
+# (at your option) any later version. 
+# 
+# This program is distributed in the hope that it will be useful, 
+# but WITHOUT ANY WARRANTY; without even the implied warranty of 
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the 
+# GNU General Public License for more details. 
+# 
+# You should have received a copy of the GNU General Public License 
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmark of per-request OAuth signing cost: a fresh oauthlib Client
+for every request (how requests used to be signed) versus one OAuthSigner
+kept for the connection's lifetime. First checks that OAuthSigner's GET
+fast path gives the same Authorization header as oauthlib.
+
+Usage: python bench/oauth_signing.py [iterations]
+"""
+
+import os, sys, timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "statusnet"))
+
+import statusnet
+if not statusnet.has_oauth:
+    sys.exit("oauthlib is needed to run this benchmark.")
+from oauthlib import oauth1
+
+TOKEN, TOKEN_SECRET = "nnch734d00sl2jdk", "pfkkdhi9sl3r4s00"
+POLL_URL = "https://identi.ca/api/statuses/home_timeline.json"
+SINCE_URL = POLL_URL + "?since_id=123456&count=20"
+POST_URL = "https://identi.ca/api/statuses/update.json"
+POST_BODY = "status=Hello%20world"
+POST_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+CHECK_URLS = [
+    POLL_URL,
+    SINCE_URL,
+    u"https://identi.ca/api/statusnet/tags/timeline/caf\xe9.json?count=20",
+    u"https://identi.ca/api/search.json?q=caf%C3%A9%20cr%C3%A8me",
+    "https://identi.ca/api/search.json?q=a+b&r=a%20b&s=%7E~",
+    "https://identi.ca/api/statuses/friends_timeline.json?a=2&a=1&b=&a=10",
+    "https://identi.ca:443/api/statuses/home_timeline.json?count=5",
+    "http://identi.ca:80/api/statuses/home_timeline.json",
+    "https://Identi.CA:8443/api/statuses/home_timeline.json?blank=&also=",
+]
+
+signer = statusnet.OAuthSigner("anonymous", "anonymous", TOKEN, TOKEN_SECRET)
+
+def check_get_signatures():
+    for url in CHECK_URLS:
+        client = oauth1.Client(u"anonymous", client_secret=u"anonymous", resource_owner_key=unicode(TOKEN), resource_owner_secret=unicode(TOKEN_SECRET), nonce=u"abc123", timestamp=u"1300000000")
+        expected = client.sign(unicode(url))[1]["Authorization"]
+        assert signer.sign_get(url, nonce="abc123", timestamp="1300000000")[1]["Authorization"] == expected, url
+
+def per_request_get(url):
+    client = oauth1.Client("anonymous", client_secret="anonymous", resource_owner_key=TOKEN, resource_owner_secret=TOKEN_SECRET)
+    return client.sign(url)
+
+def per_request_post():
+    client = oauth1.Client("anonymous", client_secret="anonymous", resource_owner_key=TOKEN, resource_owner_secret=TOKEN_SECRET)
+    return client.sign(POST_URL, http_method="POST", headers=POST_HEADERS, body=POST_BODY)
+
+cases = [
+    ("parameterless GET", lambda: per_request_get(POLL_URL), lambda: signer.sign(POLL_URL)),
+    ("GET with since_id", lambda: per_request_get(SINCE_URL), lambda: signer.sign(SINCE_URL)),
+    ("form POST", per_request_post, lambda: signer.sign(POST_URL, http_method="POST", headers=POST_HEADERS, body=POST_BODY)),
+]
+
+if __name__ == "__main__":
+    check_get_signatures()
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print "%-20s %14s %14s %8s" % ("", "before (us)", "after (us)", "speedup")
+    for name, before, after in cases:
+        before_time = min(timeit.repeat(before, number=iterations, repeat=3)) / iterations * 1e6
+        after_time = min(timeit.repeat(after, number=iterations, repeat=3)) / iterations * 1e6
+        print "%-20s %14.1f %14.1f %7.1fx" % (name, before_time, after_time, before_time / after_time)
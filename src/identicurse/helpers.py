@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU General Public License 
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import time, datetime, htmlentitydefs, re, urllib, urllib2, locale, os, platform, sys, string
+import time, datetime, calendar, htmlentitydefs, re, urllib, urllib2, os, platform, sys, string
 DATETIME_FORMAT = "%a %b %d %H:%M:%S +0000 %Y"
 offset_regex = re.compile("[+-][0-9]{4}")
 base_url_regex = re.compile("(http(s|)://.+?)/.*")
@@ -23,21 +23,55 @@ title_regex = re.compile("\<title\>(.*)\<\/title\>")
 ur1_regex = re.compile("Your ur1 is: <a.+?>(http://ur1\.ca/[0-9A-Za-z]+)")
 url_regex = re.compile("(?:ht|f)tp[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+")
 domain_regex = re.compile("http(s|)://(www\.|)(.+?)(/.*|)$")
+month_numbers = dict([(month, number) for (number, month) in enumerate(["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], 1)])
+relative_times = {}  # (count, unit) -> the string for it, so each one is only built once
 
 
 def normalise_datetime(timestring):
-    locale.setlocale(locale.LC_TIME, 'C')  # hacky fix because statusnet uses english timestrings regardless of locale
-    datetime_no_offset = offset_regex.sub("+0000", timestring)
-    attempts = 10
-    while attempts > 0:
-        attempts -= 1
-        try:
-            normalised_datetime = datetime.datetime.strptime(datetime_no_offset, DATETIME_FORMAT) + utc_offset(timestring)
-            break
-        except ValueError:  # something else changed the locale, and Python threw a hissy fit
-            pass
-    locale.setlocale(locale.LC_TIME, '') # other half of the hacky fix - resets locale
-    return normalised_datetime
+    """ Parse a time string in DATETIME_FORMAT (allowing any offset) without strptime, which depends on the locale. """
+    try:
+        weekday, month, day, clock, offset, year = timestring.split()
+        hour, minute, second = clock.split(":")
+        parsed_datetime = datetime.datetime(int(year), month_numbers[month], int(day), int(hour), int(minute), int(second))
+    except (ValueError, KeyError):
+        raise ValueError("time data %r does not match format %r" % (timestring, DATETIME_FORMAT))
+    return parsed_datetime + utc_offset(offset)
+
+def stamp_datetime(notice):
+    """ Parse notice's created_at (and that of the notice it repeats) once, storing it as ic__raw_datetime and ic__epoch. """
+    for n in [notice, notice.get("retweeted_status")]:
+        if n is not None and "created_at" in n:
+            n["ic__raw_datetime"] = normalise_datetime(n["created_at"])
+            n["ic__epoch"] = calendar.timegm(n["ic__raw_datetime"].timetuple())
+
+def notice_epoch(notice):
+    """ Return notice's ic__epoch, stamping it first if it didn't come in through stamp_datetime. """
+    if not "ic__epoch" in notice:
+        stamp_datetime(notice)
+    return notice["ic__epoch"]
+
+def relative_time(epoch, now):
+    """ Return how long before now epoch was, as format_time(time_since(...), short_form=True) puts it, and when that will next change. """
+    seconds = int(now - epoch)
+    if seconds < 1:
+        count, unit, changes_after = 0, "s", 1
+    elif seconds < 60:
+        count, unit, changes_after = seconds, "s", seconds + 1
+    elif seconds < (60 * 60):  # rounded to the nearest unit, so it changes on the half
+        count, unit = (seconds + 30) / 60, "m"
+        changes_after = min(count * 60 + 30, 60 * 60)
+    elif seconds < (60 * 60 * 24):
+        count, unit = (seconds + (60 * 30)) / (60 * 60), "h"
+        changes_after = min(count * (60 * 60) + (60 * 30), 60 * 60 * 24)
+    else:
+        count, unit = (seconds + (60 * 60 * 12)) / (60 * 60 * 24), "d"
+        changes_after = count * (60 * 60 * 24) + (60 * 60 * 12)
+    if not (count, unit) in relative_times:
+        if count == 0:
+            relative_times[(count, unit)] = "Now"
+        else:
+            relative_times[(count, unit)] = "%d%s ago" % (count, unit)
+    return relative_times[(count, unit)], epoch + changes_after
 
 def time_since(datetime_then):
     if datetime_then > datetime.datetime.utcnow():
@@ -26,13 +26,13 @@ import random
 import platform
 import getpass
 import time
+import Queue
 
 try:
     import json
 except ImportError:
     import simplejson as json
 
-from threading import Timer
 from textbox import Textbox
 import urllib2
 
@@ -131,6 +131,7 @@ base_colours = {}
 
 class IdentiCurse(object):
     """Contains Main IdentiCurse application"""
+    input_tick = 100  # ms the main loop waits for a key before running what other threads have posted
 
     def __init__(self, additional_config={}):
         helpers.set_terminal_title("IdentiCurse")
@@ -230,6 +231,7 @@ class IdentiCurse(object):
             "/quit",
             "/mute",
             "/unmute",
+            "/netstats",
         ]
 
         # load all known commands and aliases into the command list
@@ -288,6 +290,8 @@ class IdentiCurse(object):
             config.config['filter_mode'] = "plain"
         if not "notice_limit" in config.config:
             config.config['notice_limit'] = 25
+        if not "netstats_log" in config.config:
+            config.config['netstats_log'] = ""  # where to append per-endpoint network stats on exit, if anywhere
         if not "browser" in config.config:
             config.config['browser'] = "xdg-open '%s'"
         if not "border" in config.config:
@@ -440,17 +444,15 @@ class IdentiCurse(object):
 
         if config.config["prefill_user_cache"]:
             print msg['PrefillingUserCacheInfo']
-            users = []
-            for user_profile in self.conn.statuses_friends():
-                screen_name = user_profile["screen_name"]
-                if not screen_name in users:
-                    users.append(screen_name)
-            for user in users:
-                if not hasattr(config.session_store, "user_cache"):
-                    config.session_store.user_cache = {}
-                config.session_store.user_cache[user] =\
-                    helpers.colour_from_name(
-                    [item[1] for item in base_colours.items()], user.lower())
+            if not hasattr(config.session_store, "user_cache"):
+                config.session_store.user_cache = {}
+            for user_profile in self.conn.iter_friends():
+                user = user_profile["screen_name"]
+                if not user in config.session_store.user_cache:
+                    config.session_store.user_cache[user] =\
+                        helpers.colour_from_name(
+                        [item[1] for item in base_colours.items()],
+                        user.lower())
 
         self.insert_mode = False
         self.search_mode = False
@@ -531,12 +533,14 @@ class IdentiCurse(object):
                                           config.config[\
                                               "oauth_token_secret"],
                                       save_oauth_credentials=\
-                                          config.store_oauth_keys)
+                                          config.store_oauth_keys,
+                                      cache_dir=config.config.basedir)
             else:
                 self.conn = StatusNet(config.config['api_path'],
                                       config.config['username'],
                                       config.config['password'],
-                                    validate_ssl=config.config['validate_ssl'])
+                                    validate_ssl=config.config['validate_ssl'],
+                                    cache_dir=config.config.basedir)
         except Exception, (errmsg):
             sys.exit("ERROR: Couldn't establish connection: %s" % (errmsg))
 
@@ -561,6 +565,7 @@ class IdentiCurse(object):
                 return self.redraw()
             
         self.main_window.keypad(1)
+        self.main_window.timeout(self.input_tick)
 
         y, x = self.main_window.getmaxyx()
         current_y = 0
@@ -827,10 +832,6 @@ class IdentiCurse(object):
             elif tab[0] == "help":
                 self.tabs.append(Help(self.notice_window, self.path))
 
-        self.update_timer = Timer(config.config['update_interval'],
-                                  self.update_tabs)
-        self.update_timer.start()
-
         self.current_tab = 0
         self.tabs[self.current_tab].active = True
         self.tab_order = range(len(self.tabs))
@@ -840,22 +841,49 @@ class IdentiCurse(object):
         self.tab_bar.current_tab = self.current_tab
         self.tab_bar.update()
         
+        self.posted = Queue.Queue()  # (method name, args) for the main loop to run, as only it may draw
+        self.scheduler = TabScheduler(self)
+        self.scheduler.start()
         self.update_tabs()
         self.display_current_tab()
 
         self.loop()
 
     def update_tabs(self):
-        self.update_timer.cancel()
-        if self.insert_mode == False:
-            self.status_bar.update("Updating Timelines...")
-            self.tab_bar.tabs = [tab.name for tab in self.tabs]
-            self.tab_bar.current_tab = self.current_tab
-            self.tab_bar.update()
-            TabUpdater(self.tabs, self, 'end_update_tabs').start()
-        else:
-            self.update_timer = Timer(config.config['update_interval'],
-                                      self.update_tabs)
+        self.scheduler.refresh()
+
+    def begin_update_tabs(self):
+        self.status_bar.update("Updating Timelines...")
+        self.tab_bar.tabs = [tab.name for tab in self.tabs]
+        self.tab_bar.current_tab = self.current_tab
+        self.tab_bar.update()
+
+    def post(self, name, *args):
+        """ Have the main loop call the method name with args. Other threads use this for anything that draws. """
+        self.posted.put((name, args))
+
+    def run_posted(self):
+        while True:
+            try:
+                name, args = self.posted.get_nowait()
+            except Queue.Empty:
+                return
+            getattr(self, name)(*args)
+
+    def refresh_times(self):
+        """ Repaint the times on the current tab once any of them has moved on. """
+        tab = self.tabs[self.current_tab]
+        change_at = getattr(tab, "times_change_at", None)
+        if change_at is not None and time.time() >= change_at:
+            tab.refresh_times()
+            tab.display()
+
+    def tab_updated(self, tab, updated, fetched, done, total):
+        self.status_bar.update("Updating timelines (%d/%d)..." % (done, total))
+        if updated:
+            tab.apply(fetched)
+            if tab.active:
+                tab.display()  # update the display of the tab if it's the foreground one
 
     def end_update_tabs(self):
         self.display_current_tab()
@@ -865,9 +893,6 @@ class IdentiCurse(object):
         self.tab_bar.tabs = [tab.name for tab in self.tabs]
         self.tab_bar.current_tab = self.current_tab
         self.tab_bar.update()
-        self.update_timer = Timer(config.config['update_interval'],
-                                  self.update_tabs)
-        self.update_timer.start()
 
     def update_tab_buffers(self):
         for tab in self.tabs:
@@ -898,6 +923,11 @@ class IdentiCurse(object):
 
         while self.running:
             input = self.main_window.getch()
+            self.run_posted()
+            self.refresh_times()
+            if input == curses.ERR:  # no key within input_tick; waking was only to run the above
+                continue
+            self.scheduler.touch()  # coming back from idle can bring updates forward
            
             if self.qreply == False:
                 switch_to_tab = None
@@ -943,10 +973,10 @@ class IdentiCurse(object):
                     self.tabs[self.current_tab].active = False
                     self.current_tab = switch_to_tab
                     self.tabs[self.current_tab].active = True
+                    self.scheduler.touch()
             else:
                 for x in range(1, 9):
                     if input == ord(str(x)):
-                        self.update_timer.cancel()
                         self.insert_mode = True
                         self.parse_input(self.text_entry.edit("/r " +\
                                                               str(x) + " "))
@@ -993,15 +1023,12 @@ class IdentiCurse(object):
             elif input in self.keybindings['refresh']:
                 self.update_tabs()
             elif input in self.keybindings['input']:
-                self.update_timer.cancel()
                 self.insert_mode = True
                 self.parse_input(self.text_entry.edit())
             elif input in self.keybindings['commandinput']:
-                self.update_timer.cancel()
                 self.insert_mode = True
                 self.parse_input(self.text_entry.edit("/"))
             elif input in self.keybindings['search']:
-                self.update_timer.cancel()
                 self.insert_mode = True
                 self.search_mode = True
                 self.parse_search(self.text_entry.edit())
@@ -1094,10 +1121,8 @@ class IdentiCurse(object):
                     self.tabs[self.current_tab].timeline):
                     self.tabs[self.current_tab].chosen_one = len(
                         self.tabs[self.current_tab].timeline) - 1
-                    self.tabs[self.current_tab].update_buffer()
 
                 if input in self.keybindings['creply']:
-                    self.update_timer.cancel()
                     self.insert_mode = True
                     if "direct" in self.tabs[self.current_tab].timeline_type:
                         self.parse_input(self.text_entry.edit("/dm " + str(
@@ -1108,7 +1133,6 @@ class IdentiCurse(object):
                                     self.tabs[self.current_tab].chosen_one +\
                                         1) + " "))
                 elif input in self.keybindings['creplymode']:
-                    self.update_timer.cancel()
                     if "direct" in self.tabs[self.current_tab].timeline_type:
                         self.insert_mode = True
                         self.parse_input(self.text_entry.edit("/dm " + str(
@@ -1134,28 +1158,24 @@ class IdentiCurse(object):
                     if self.tabs[self.current_tab].chosen_one != (len(
                             self.tabs[self.current_tab].timeline) - 1):
                         self.tabs[self.current_tab].chosen_one += 1
-                        self.tabs[self.current_tab].update_buffer()
                         self.tabs[self.current_tab].scrolltodent(
                             self.tabs[self.current_tab].chosen_one,
                             smooth_scroll=config.config["smooth_cscroll"])
                 elif input in self.keybindings['cprev']:
                     if self.tabs[self.current_tab].chosen_one != 0:
                         self.tabs[self.current_tab].chosen_one -= 1
-                        self.tabs[self.current_tab].update_buffer()
                         self.tabs[self.current_tab].scrolltodent(
                             self.tabs[self.current_tab].chosen_one,
                             smooth_scroll=config.config["smooth_cscroll"])
                 elif input in self.keybindings['cfirst']:
                     if self.tabs[self.current_tab].chosen_one != 0:
                         self.tabs[self.current_tab].chosen_one = 0
-                        self.tabs[self.current_tab].update_buffer()
                         self.tabs[self.current_tab].scrolltodent(
                             self.tabs[self.current_tab].chosen_one)
                 elif input in self.keybindings['clast']:
                     last_index = len(self.tabs[self.current_tab].timeline) - 1
                     if self.tabs[self.current_tab].chosen_one != last_index:
                         self.tabs[self.current_tab].chosen_one = last_index
-                        self.tabs[self.current_tab].update_buffer()
                         self.tabs[self.current_tab].scrolltodent(
                             self.tabs[self.current_tab].chosen_one)
                 elif input in self.keybindings['cfav']:
@@ -1201,7 +1221,6 @@ class IdentiCurse(object):
                         # we must be in a Context tab, so repeating is fine.
                         pass
                     if can_repeat:
-                        self.update_timer.cancel()
                         self.cmd_quote(
                             self.tabs[self.current_tab].timeline[\
                                 self.tabs[self.current_tab].chosen_one])
@@ -1679,6 +1698,9 @@ class IdentiCurse(object):
                             self.tabs[self.current_tab].timeline[
                                 int(tokens[1]) - 1])
 
+                    elif tokens[0] == "/netstats" and len(tokens) == 1:
+                        self.cmd_netstats()
+
                     elif tokens[0] == "/quit" and len(tokens) == 1:
                         self.running = False
    
@@ -1703,9 +1725,7 @@ class IdentiCurse(object):
         self.display_current_tab()
         self.status_bar.do_nothing()
         self.insert_mode = False
-        self.update_timer = Timer(config.config['update_interval'],
-                                  self.update_tabs)
-        self.update_timer.start()
+        self.scheduler.touch()
 
     # decorator factory, creates decorators to deal with the
     # standard switching to tab stuff
@@ -1751,22 +1771,24 @@ class IdentiCurse(object):
             self = largs[0]
             update = cmd(*largs, **kargs)
             if update is not None:
-                update["ic__raw_datetime"] = helpers.normalise_datetime(
-                    update["created_at"])
-                update["ic__from_web"] = False
+                if isinstance(update, list):  # a long notice that was split up
+                    updates = update
+                else:
+                    updates = [update]
+                for notice in updates:
+                    helpers.stamp_datetime(notice)
+                    notice["ic__from_web"] = False
                 # if we're in a context tab, add notice to there too
                 if self.tabs[self.current_tab].name == "Context":
-                    self.tabs[self.current_tab].timeline.insert(0, update)
+                    for notice in updates:
+                        self.tabs[self.current_tab].timeline.insert(0, notice)
                     self.tabs[self.current_tab].update_buffer()
                 for tab in self.tabs:
                     if not hasattr(tab, 'timeline_type'):
                         continue
                     if tab.timeline_type in ["home", "public"]:
-                        if isinstance(update, list):
-                            for notice in update:
-                                tab.timeline.insert(0, notice)
-                        else:
-                            tab.timeline.insert(0, update)
+                        for notice in updates:
+                            tab.timeline.insert(0, notice)
                         tab.update_buffer()
             self.status_bar.do_nothing()
             return True
@@ -1924,12 +1946,11 @@ class IdentiCurse(object):
     @shows_status("Deploying orbital nukes")
     @posts_notice
     def cmd_spamreport(self, username, reason=""):
-        target_user_id = self.conn.users_show(screen_name=username)["id"]
+        (target_user_id, user_id), (group_id,) = self.conn.lookup_ids(
+            [username, ""], ["spamreport"])
         status = "@support !sr %s UID %d" % (username, target_user_id)
         if len(reason) > 0:
             status += " %s" % (reason)
-        user_id = self.conn.users_show()['id']
-        group_id = self.conn.statusnet_groups_show(nickname="spamreport")['id']
         if not self.conn.statusnet_groups_is_member(user_id, group_id):
             self.status_bar.timed_update(msg["SpamreportGroupInfo"])
         self.conn.blocks_create(user_id=target_user_id, screen_name=username)
@@ -2000,8 +2021,7 @@ class IdentiCurse(object):
 
     @shows_status("Checking if you are a member of that group")
     def cmd_groupmember(self, group):
-        user_id = self.conn.users_show()['id']
-        group_id = self.conn.statusnet_groups_show(nickname=group)['id']
+        (user_id,), (group_id,) = self.conn.lookup_ids([""], [group])
         if self.conn.statusnet_groups_is_member(user_id, group_id):
             self.status_bar.timed_update("You are a member of !%s." % (group))
         else:
@@ -2043,6 +2063,10 @@ class IdentiCurse(object):
     def cmd_public(self):
         return Timeline(self.conn, self.notice_window, "public")
 
+    @opens_tab()
+    def cmd_netstats(self):
+        return NetStats(self.conn, self.notice_window)
+
     @shows_status("Changing config")
     def cmd_config(self, key, value):
         key = key.split('.')
@@ -2217,16 +2241,25 @@ class IdentiCurse(object):
         self.display_current_tab()
         self.insert_mode = False
         self.search_mode = False
-        self.update_timer = Timer(
-            config.config['update_interval'], self.update_tabs)
-        self.update_timer.start()
+        self.scheduler.touch()
 
     def quit(self):
-        try:
-            self.update_timer.cancel()
-        except ValueError:
-            # it may already have been cancelled if it fired
-            # shortly before we quit, in which case we can't end it
-            pass
+        self.scheduler.stop()
         curses.endwin()
+        if config.config['netstats_log'] != "":
+            self.log_netstats(os.path.expanduser(config.config['netstats_log']))
         sys.exit()
+
+    def log_netstats(self, path):
+        """ Append this session's per-endpoint network stats to path, one JSON object per endpoint. """
+        session = {"time": int(time.time()), "api_path": config.config['api_path'],
+                   "update_interval": config.config['update_interval'],
+                   "notice_limit": config.config['notice_limit']}
+        try:
+            with open(path, "a") as log_file:
+                for endpoint, stats in sorted(self.conn.netstats().items()):
+                    line = dict(session, endpoint=endpoint)
+                    line.update(stats)
+                    log_file.write(json.dumps(line) + "\n")
+        except IOError, e:
+            print "Could not write network stats to %s: %s" % (path, e)
@@ -16,16 +16,34 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from helpers import DATETIME_FORMAT
-import os.path, re, sys, threading, datetime, locale, curses, random, httplib
+import os.path, re, sys, threading, Queue, datetime, time, locale, curses, random, httplib, bisect
 import identicurse, config, helpers
 from operator import itemgetter
-from statusnet import StatusNetError
+from statusnet import StatusNetError, CircuitOpenError, RateLimitedError, ValidatorCache
+
+def count_text(c):
+    """ Return how notice number c is shown, padded so the first nine line up with the rest. """
+    if c < 10:
+        return " " + str(c)
+    return str(c)
 
 class Buffer(list):
     def __init__(self):
         list.__init__(self)
+        self.version = 0  # bumped on every change, so painters can tell when they're out of date
+        self.reflows = {}  # width -> (the reflowed lines, the reflowed line each buffer line starts on)
 
     def append(self, item):
+        list.append(self, self.clean(item))
+        self.version += 1
+
+    def append_clean(self, item):
+        """ Append a line that has already been through clean(). """
+        list.append(self, item)
+        self.version += 1
+
+    def clean(self, item):
+        """ Return a copy of the line item with every block made safe to draw. """
         clean_item = []
         for block in item:
             if len(block) < 3:
@@ -51,16 +69,71 @@ class Buffer(list):
                     clean_item.append(clean_block)
             except TypeError:
                 raise Exception(item)
-        list.append(self, clean_item)
+        return clean_item
         
     def clear(self):
         self[:] = []
+        self.reflows = {}  # lines were thrown away, so nothing reflowed so far can be trusted
+        self.version += 1
+
+    def patch(self, lines):
+        """ Make the buffer hold lines, which must already be clean. Lines that are the very same objects at either end are left alone, reflowed lines and all. """
+        start = 0
+        common = min(len(self), len(lines))
+        while start < common and self[start] is lines[start]:
+            start += 1
+        tail = 0
+        while tail < common - start and self[len(self) - 1 - tail] is lines[len(lines) - 1 - tail]:
+            tail += 1
+        if start + tail == len(self) == len(lines):
+            return
+        self.splice(start, len(self) - tail, lines[start:len(lines) - tail])
+
+    def splice(self, start, end, lines):
+        """ Replace buffer lines start to end with lines (already clean), shifting the reflowed lines after them rather than wrapping them again. """
+        for width, (reflowed_buffer, line_starts) in self.reflows.items():
+            if len(line_starts) < end:  # not reflowed that far yet, so keep what's before start and let reflowed() do the rest
+                keep = min(start, len(line_starts))
+                if keep < len(line_starts):
+                    reflowed_buffer = reflowed_buffer[:line_starts[keep]]
+                self.reflows[width] = (reflowed_buffer, line_starts[:keep])
+                continue
+            reflowed_start = line_starts[start] if start < len(line_starts) else len(reflowed_buffer)
+            reflowed_end = line_starts[end] if end < len(line_starts) else len(reflowed_buffer)
+            new_reflowed, new_starts = [], []
+            self.reflow(lines, width, new_reflowed, new_starts)
+            shift = len(new_reflowed) - (reflowed_end - reflowed_start)
+            self.reflows[width] = (reflowed_buffer[:reflowed_start] + new_reflowed + reflowed_buffer[reflowed_end:],
+                    line_starts[:start] + [reflowed_start + line_start for line_start in new_starts] + [line_start + shift for line_start in line_starts[end:]])
+        self[start:end] = lines
+        self.version += 1
+
+    def line_at(self, width, reflowed_line):
+        """ Return which buffer line the reflowed line was wrapped from. """
+        self.reflowed(width)
+        return bisect.bisect_right(self.reflows[width][1], reflowed_line) - 1
 
     def reflowed(self, width):
-        """ Return a reflowed-for-width copy of the buffer as a list. """
-        reflowed_buffer = []
+        """ Return the buffer reflowed for width, as a list. It is kept for the next call, so don't change it. """
+        if not width in self.reflows:
+            self.reflows[width] = ([], [])
+        reflowed_buffer, line_starts = self.reflows[width]
+        if len(line_starts) < len(self):  # anything appended since last time just goes on the end
+            self.reflow(self[len(line_starts):], width, reflowed_buffer, line_starts)
+        return reflowed_buffer
 
-        for raw_line in self:
+    def reflowed_lines(self, width, first, last):
+        """ Return the first and last reflowed lines that buffer lines first to last were wrapped onto. """
+        reflowed_buffer = self.reflowed(width)
+        line_starts = self.reflows[width][1]
+        if last + 1 < len(line_starts):
+            return line_starts[first], line_starts[last + 1] - 1
+        return line_starts[first], len(reflowed_buffer) - 1
+
+    def reflow(self, lines, width, reflowed_buffer, line_starts):
+        """ Wrap lines to width, adding them to the end of reflowed_buffer and noting where each one starts in line_starts. """
+        for raw_line in lines:
+            line_starts.append(len(reflowed_buffer))
             reflowed_buffer.append([])
             line_length = 0
             line = raw_line[:]
@@ -83,31 +156,154 @@ class Buffer(list):
                     reflowed_buffer[-1].append(block)
                     line_length += block_len
 
-        return reflowed_buffer
-
 class TabUpdater(threading.Thread):
+    workers = 4  # tabs updated at once; matches the connections the pool keeps open per host
+
     def __init__(self, tabs, callback_object, callback_function):
         threading.Thread.__init__(self)
         self.daemon = True
         self.tabs = tabs
         self.callback_object = callback_object
         self.callback_function = callback_function
+        self.halted = threading.Event()  # set when the server is struggling, so tabs still queued are skipped
 
     def run (self):
         config.session_store.update_error=None
-        for tab in self.tabs:
+        pending = Queue.Queue()
+        for tab in sorted(self.tabs, key=lambda tab: not tab.active):  # the tab on screen goes first
+            pending.put(tab)
+        finished = Queue.Queue()
+        for n in xrange(min(self.workers, len(self.tabs))):
+            worker = threading.Thread(target=self.work, args=(pending, finished))
+            worker.daemon = True
+            worker.start()
+
+        for done in xrange(len(self.tabs)):  # curses isn't thread-safe, so what each tab fetched is handed to the main loop to put on screen
+            tab, updated, fetched = finished.get()
+            self.callback_object.post("tab_updated", tab, updated, fetched, done + 1, len(self.tabs))
+
+        self.callback_object.post(self.callback_function)
+
+    def work(self, pending, finished):
+        while True:
             try:
-                self.callback_object.status_bar.update("Updating '%s'..." % (tab.name))
-                tab.update()
-            except StatusNetError, e:
-                config.session_store.update_error="OStatus error %d in '%s': %s" % (e.errcode, tab.name, e.details)
-            if tab.active:
-                tab.display()  # update the display of the tab if it's the foreground one
-
-        fun = getattr(self.callback_object, self.callback_function)
-        fun()
+                tab = pending.get_nowait()
+            except Queue.Empty:
+                return
+            updated, fetched = False, None
+            try:
+                if not self.halted.is_set():
+                    updated, fetched = self.update(tab)
+            finally:
+                finished.put((tab, updated, fetched))  # even if update() blew up, or run() would wait for this tab forever
+
+    def update(self, tab):
+        retry_in = self.callback_object.conn.circuit_retry_in()
+        if retry_in > 0:  # the server is struggling, so leave it alone until the circuit closes
+            config.session_store.update_error = "Server degraded, retrying in %ds" % (retry_in)
+            self.halted.set()
+            return False, None
+        try:
+            with self.callback_object.conn.background():
+                return True, tab.fetch()
+        except CircuitOpenError, e:
+            config.session_store.update_error = "Server degraded, retrying in %ds" % (e.retry_in)
+            self.halted.set()
+        except RateLimitedError, e:  # only this tab waited too long; the ones still queued may well get through
+            config.session_store.update_error = e.details
+        except StatusNetError, e:
+            config.session_store.update_error="OStatus error %d in '%s': %s" % (e.errcode, tab.name, e.details)
+        return False, None
+
+class TabScheduler(threading.Thread):
+    """ Polls each tab on its own interval, from one long-lived thread. """
+    rates = {"mentions": 0.5, "direct": 0.5, "public": 4, "search": 4}  # multiples of update_interval; other tabs poll at 1x
+    max_backoff = 8  # a tab that keeps coming back empty slows to at most this multiple of its rate
+    idle_after = 600  # seconds without a keypress before the user counts as away
+    idle_backoff = 4  # and while they're away, every tab polls this much slower
+
+    def __init__(self, app):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.app = app
+        self.wakeup = threading.Condition()
+        self.running = True
+        self.forced = False
+        self.last_input = time.time()
+        self.polled = {}  # tab -> (when it was last updated, updates in a row that found nothing new)
+
+    def run(self):
+        while True:
+            with self.wakeup:
+                if not self.running:
+                    return
+                due, wait = self.due()
+                if len(due) == 0:
+                    self.wakeup.wait(wait)
+                    continue
+            held = self.app.conn.cycle_delay(len(due))
+            if held > 0:  # not enough quota to poll this often, so hold the whole cycle back rather than let half of it through
+                with self.wakeup:
+                    self.wakeup.wait(held)
+                continue
+            with self.wakeup:
+                self.forced = False
+            started = time.time()
+            self.app.post("begin_update_tabs")
+            TabUpdater(due, self.app, 'end_update_tabs').run()
+            for tab in due:
+                if tab.fresh > 0:
+                    self.polled[tab] = (started, 0)
+                else:
+                    self.polled[tab] = (started, self.polled.get(tab, (0, 0))[1] + 1)
+
+    def due(self):
+        """ Return the tabs to update now, and how long to sleep if there are none. """
+        if self.app.insert_mode or self.app.reply_mode or self.app.quote_mode:
+            return [], 1  # don't draw over the user's typing; look again shortly
+        now = time.time()
+        tabs = list(self.app.tabs)
+        self.polled = dict((tab, self.polled.get(tab, (now, 0))) for tab in tabs)  # a newly opened tab has just been updated
+        if self.forced:
+            return tabs, None
+        due, wait = [], None
+        for tab in tabs:
+            left = self.polled[tab][0] + self.interval(tab, now) - now
+            if left <= 0:
+                due.append(tab)
+            elif wait is None or left < wait:
+                wait = left
+        return due, wait
+
+    def interval(self, tab, now):
+        """ Seconds between updates of tab, as things stand now. """
+        interval = config.config['update_interval'] * self.rates.get(getattr(tab, "timeline_type", None), 1)
+        if not tab.active:  # the tab on screen always polls at its full rate
+            interval *= min(2 ** self.polled[tab][1], self.max_backoff)
+        if now - self.last_input > self.idle_after:
+            interval *= self.idle_backoff
+        return interval
+
+    def refresh(self):
+        """ Update every tab as soon as possible, whatever its interval. """
+        with self.wakeup:
+            self.forced = True
+            self.wakeup.notify()
+
+    def touch(self):
+        """ Note a keypress; the user coming back or switching tabs can bring updates forward. """
+        with self.wakeup:
+            self.last_input = time.time()
+            self.wakeup.notify()
+
+    def stop(self):
+        with self.wakeup:
+            self.running = False
+            self.wakeup.notify()
 
 class Tab(object):
+    painted = {}  # window -> what was last drawn in it, so an unchanged tab needn't be drawn again
+
     def __init__(self, window):
         self.window = window
         self.buffer = Buffer()
@@ -117,6 +313,10 @@ class Tab(object):
         self.search_highlight_line = -1
         self.active = False
         self.paused = False
+        self.fresh = 0  # notices the last update() brought in
+        self.selector_cells = {}  # notice index -> (y, x, attr) of its selector, for the notices on screen
+        self.selector_drawn = None
+        self.time_cells = {}  # notice index -> (y, x, attr, what was drawn) of its time, for the notices on screen
         
     def prevpage(self, n=1):
         if hasattr(self, "timeline"):
@@ -178,42 +378,67 @@ class Tab(object):
 
     def scrolltodent(self, n, smooth_scroll=False):
         maxy, maxx = self.window.getmaxyx()[0], self.window.getmaxyx()[1]
-        if n < 9:
-            nout = " " + str(n+1)
-        else:
-            nout = str(n+1)
-        dent_line = 0
-        found_dent = False
-        for line in self.buffer.reflowed(maxx - 2):
-            for block in line:
-                if block[1] == identicurse.colour_fields['notice_count'] and block[0] == nout:
-                    if smooth_scroll and (dent_line >= (maxy - 3 + self.start_line)):
-                        buffer_cache = self.buffer.reflowed(maxx - 2)
-                        while True:
-                            if dent_line == len(buffer_cache) - 1:
-                                break
-                            line_length = 0
-                            for block in buffer_cache[dent_line+1]:
-                                line_length += len(block[0])
-                            if line_length == 0:
-                                break
-                            dent_line += 1
-                        self.scrollto(dent_line, force_top=False)
-                    elif (dent_line >= (maxy - 3 + self.start_line)) or (dent_line < self.start_line):
-                        self.scrollto(dent_line, force_top=True)
-                    return
-            dent_line += 1
+        notice_lines = getattr(self, "notice_lines", [])
+        if n >= len(notice_lines):
+            return
+        dent_line, dent_end = self.buffer.reflowed_lines(maxx - 2, *notice_lines[n])
+        if smooth_scroll and (dent_line >= (maxy - 3 + self.start_line)):
+            self.scrollto(dent_end, force_top=False)
+        elif (dent_line >= (maxy - 3 + self.start_line)) or (dent_line < self.start_line):
+            self.scrollto(dent_line, force_top=True)
+
+    def fetch(self):
+        """ Do the network half of update(), returning what apply() needs. This runs on the update workers, so it mustn't touch the screen or anything drawn from. """
+        return None
+
+    def apply(self, fetched):
+        """ Do the rest of update() with what fetch() returned. This builds the buffer, so it must run on the main thread. """
+        self.update_buffer()
+
+    def update(self):
+        self.apply(self.fetch())
+
+    def notice_at(self, line):
+        """ Return the index of the notice whose number is on buffer line line, if any. """
+        return None
 
     def display(self):
         maxy, maxx = self.window.getmaxyx()[0], self.window.getmaxyx()[1]
+        chosen = getattr(self, "chosen_one", None)
+        state = (self, self.start_line, self.buffer.version, self.search_highlight_line, maxy, maxx)
+        if Tab.painted.get(self.window) == state:  # only the selector and times can have changed
+            self.paint_selector(chosen)
+            self.paint_times()
+            self.window.refresh()
+            return
         self.window.erase()
 
+        self.selector_cells = {}
+        self.time_cells = {}
+        notice = None
         buffer = self.buffer.reflowed(maxx - 2)
         line_num = self.start_line
         for line in buffer[self.start_line:maxy - 3 + self.start_line]:
             remaining_line_length = maxx - 2
             try:
                 for (part, attr, min_x_offset) in line:
+                    if attr == identicurse.colour_fields["notice_count"]:  # lines are kept while notices move, so the number is drawn over them too
+                        notice = self.notice_at(self.buffer.line_at(maxx - 2, line_num))
+                        if notice is not None:
+                            part = count_text(notice + 1)
+                    elif attr == identicurse.colour_fields["selector"] and notice is not None:  # drawn over the buffer, so moving it needn't touch the buffer
+                        if line_num == self.search_highlight_line:
+                            attr = identicurse.colour_fields['search_highlight']
+                        y, x = self.window.getyx()
+                        self.selector_cells[notice] = (y, x, attr)
+                        if notice == chosen:
+                            part = ' * '
+                    elif attr == identicurse.colour_fields["time"] and notice is not None:  # likewise, so times can tick over on their own
+                        part = self.shown_time(notice, part)
+                        if line_num == self.search_highlight_line:
+                            attr = identicurse.colour_fields['search_highlight']
+                        y, x = self.window.getyx()
+                        self.time_cells[notice] = (y, x, attr, part)
                     if ((maxx - 2) - remaining_line_length) < min_x_offset:
                         remain_indent = min_x_offset - ((maxx - 2) - remaining_line_length)
                         self.window.addstr(" "*remain_indent, curses.color_pair(attr))
@@ -232,8 +457,38 @@ class Tab(object):
             except:  # if we somehow already hit the bottom (maybe there were weird chars?)
                 pass  # just ignore it and move on
             line_num += 1
+        self.selector_drawn = chosen
+        Tab.painted[self.window] = state
         self.window.refresh()
 
+    def paint_selector(self, chosen):
+        """ Move the selector onto notice chosen, redrawing only the two cells involved. """
+        if chosen == self.selector_drawn:
+            return
+        for notice, selector in [(self.selector_drawn, ' ' * 3), (chosen, ' * ')]:
+            if notice in self.selector_cells:
+                y, x, attr = self.selector_cells[notice]
+                try:
+                    self.window.addstr(y, x, selector, curses.color_pair(attr))
+                except curses.error:  # the last cell of the window can't be written without scrolling
+                    pass
+        self.selector_drawn = chosen
+
+    def shown_time(self, notice, laid_out):
+        """ Return what to draw for notice's time, in place of laid_out. It must be the same length. """
+        return laid_out
+
+    def paint_times(self):
+        """ Redraw the times on screen that have changed since they were drawn, and nothing else. """
+        for notice, (y, x, attr, drawn) in self.time_cells.items():
+            time_msg = self.shown_time(notice, drawn)
+            if time_msg != drawn:
+                try:
+                    self.window.addstr(y, x, time_msg, curses.color_pair(attr))
+                except curses.error:
+                    pass
+                self.time_cells[notice] = (y, x, attr, time_msg)
+
 class Help(Tab):
     def __init__(self, window, identicurse_path):
         self.name = "Help"
@@ -248,6 +503,37 @@ class Help(Tab):
         for l in open(self.path, 'r').readlines():
             self.buffer.append([(l, identicurse.colour_fields['none'])])
 
+class NetStats(Tab):
+    def __init__(self, conn, window):
+        self.conn = conn
+        self.name = "Network Stats"
+        Tab.__init__(self, window)
+
+    def update(self):
+        self.update_buffer()
+
+    def update_buffer(self):
+        self.buffer.clear()
+        stats = self.conn.netstats()
+        if len(stats) == 0:
+            self.buffer.append([("No requests made yet.", identicurse.colour_fields['none'])])
+            return
+        for endpoint in sorted(stats.keys()):
+            endpoint_stats = stats[endpoint]
+            self.buffer.append([(endpoint, identicurse.colour_fields['profile_title'])])
+            latencies = []
+            for percentile in ("p50", "p95", "p99"):
+                if endpoint_stats.get(percentile) is not None:
+                    latencies.append("%s %dms" % (percentile, endpoint_stats[percentile] * 1000))
+            if len(latencies) > 0:
+                self.buffer.append([("  requests: %d, latency: %s" % (endpoint_stats.get('count', 0), ", ".join(latencies)), identicurse.colour_fields['none'])])
+            self.buffer.append([("  bytes out: %d, bytes in: %d (%d decoded)" % (endpoint_stats.get('bytes_out', 0), endpoint_stats.get('bytes_in', 0), endpoint_stats.get('bytes_decoded', 0)), identicurse.colour_fields['none'])])
+            self.buffer.append([("  retries: %d, bad status lines: %d, coalesced: %d" % (endpoint_stats.get('retries', 0), endpoint_stats.get('bad_status_lines', 0), endpoint_stats.get('coalesced', 0)), identicurse.colour_fields['none'])])
+            errors = endpoint_stats.get('errors', {})
+            if len(errors) > 0:
+                self.buffer.append([("  errors: %s" % (", ".join(["%s x%d" % (code, errors[code]) for code in sorted(errors.keys())])), identicurse.colour_fields['warning'])])
+            self.buffer.append([("", identicurse.colour_fields['none'])])
+
 class Timeline(Tab):
     def __init__(self, conn, window, timeline, type_params={}):
         self.conn = conn
@@ -262,6 +548,16 @@ class Timeline(Tab):
         self.timeline_type = timeline
         self.type_params = type_params
         self.chosen_one = 0
+        self.validators = ValidatorCache(16)  # this tab's own, since a 304 only means "nothing new" to a tab already holding the page
+        self.missing_hits = []  # ids of search hits that couldn't be fetched
+        self.render_cache = {}  # notice id -> the parts of its lines that don't move with it
+        self.render_signature = None
+        self.notice_lines = []  # (first, last) buffer lines of each notice, not counting the blank line after it
+        self.header_lines = {}  # buffer line -> index of the notice whose number is on it
+        self.notice_epochs = []  # (metadata, shown) epoch of each notice, which its times are worked out from
+        self.laid_out_times = {}  # epoch -> the time the buffer was built with
+        self.times = {}  # epoch -> the time as it should read now
+        self.times_change_at = None  # when the next of those goes out of date
 
         if self.timeline_type == "user":
             self.basename = "@%s" % self.type_params['screen_name']
@@ -288,96 +584,99 @@ class Timeline(Tab):
         if self.paused:
             self.name = self.name + " (paused)"
 
-    def update(self):
-        self.update_name()
-
+    def fetch(self):
         if self.paused:
-            self.update_buffer()
-            return
+            self.fresh = 0
+            return None
 
         get_count = config.config['notice_limit']
+        page = self.page
+        profile = getattr(self, "profile", None)
 
-        if self.prev_page != self.page:
-            self.timeline = []
+        timeline = self.timeline
+        if self.prev_page != page:
+            timeline = []
+        missing = []
+        if len(timeline) == 0:  # nothing to fall back on, so the whole page has to come down
+            self.validators = ValidatorCache(16)
 
         last_id = 0
-        if len(self.timeline) > 0:
-            for notice in self.timeline:
+        if len(timeline) > 0:
+            for notice in timeline:
                 if notice["ic__from_web"]:  # don't consider inserted posts latest
                     last_id = notice['id']
                     break
 
-        if self.timeline_type == "home":
-            raw_timeline = self.conn.statuses_home_timeline(count=get_count, page=self.page, since_id=last_id)
-        elif self.timeline_type == "mentions":
-            raw_timeline = self.conn.statuses_mentions(count=get_count, page=self.page, since_id=last_id)
-        elif self.timeline_type == "direct":
-            raw_timeline = self.conn.direct_messages(count=get_count, page=self.page, since_id=last_id)
-        elif self.timeline_type == "user":
-            raw_timeline = self.conn.statuses_user_timeline(user_id=self.type_params['user_id'], screen_name=self.type_params['screen_name'], count=get_count, page=self.page, since_id=last_id)
-            try:
-                self.profile = self.conn.users_show(screen_name=self.type_params['screen_name'])
-                # numerical fields, convert them to strings to make the buffer code more clean
-                for field in ['id', 'created_at', 'followers_count', 'friends_count', 'favourites_count', 'statuses_count']:
-                    self.profile[field] = str(self.profile[field])
-
-                # special handling for following
-                if self.profile['following']:
-                    self.profile['following'] = "Yes"
+        with self.conn.streaming(last_id == 0), self.conn.conditional(self.validators):  # a whole page is big, so dedupe and filter it as it downloads
+            if self.timeline_type == "home":
+                raw_timeline = self.conn.statuses_home_timeline(count=get_count, page=page, since_id=last_id)
+            elif self.timeline_type == "mentions":
+                raw_timeline = self.conn.statuses_mentions(count=get_count, page=page, since_id=last_id)
+            elif self.timeline_type == "direct":
+                raw_timeline = self.conn.direct_messages(count=get_count, page=page, since_id=last_id)
+            elif self.timeline_type == "user":
+                raw_timeline = self.conn.statuses_user_timeline(user_id=self.type_params['user_id'], screen_name=self.type_params['screen_name'], count=get_count, page=page, since_id=last_id)
+                try:
+                    profile = self.conn.users_show(screen_name=self.type_params['screen_name'], force_refresh=True)  # counts change, so don't show a cached copy
+                    # numerical fields, convert them to strings to make the buffer code more clean
+                    for field in ['id', 'created_at', 'followers_count', 'friends_count', 'favourites_count', 'statuses_count']:
+                        profile[field] = str(profile[field])
+
+                    # special handling for following
+                    if profile['following']:
+                        profile['following'] = "Yes"
+                    else:
+                        profile['following'] = "No"
+
+                    # create this field specially
+                    datetime_joined = helpers.normalise_datetime(profile['created_at'])
+                    days_since_join = helpers.single_unit(helpers.time_since(datetime_joined), "days")['days']
+                    profile['notices_per_day'] = "%0.2f" % (float(profile['statuses_count']) / days_since_join)
+
+                except StatusNetError, e:
+                    if e.errcode == 404:
+                        profile = None
+            elif self.timeline_type == "group":
+                raw_timeline = self.conn.statusnet_groups_timeline(group_id=self.type_params['group_id'], nickname=self.type_params['nickname'], count=get_count, page=page, since_id=last_id)
+                try:
+                    profile = self.conn.statusnet_groups_show(nickname=self.type_params['nickname'], force_refresh=True)
+                    # numerical fields, convert them to strings to make the buffer code more clean
+                    for field in ['id', 'created', 'member_count']:
+                        profile[field] = str(profile[field])
+
+                except StatusNetError, e:
+                    if e.errcode == 404:
+                        profile = None
+            elif self.timeline_type == "tag":
+                raw_timeline = self.conn.statusnet_tags_timeline(tag=self.type_params['tag'], count=get_count, page=page, since_id=last_id)
+            elif self.timeline_type == "sentdirect":
+                raw_timeline = self.conn.direct_messages_sent(count=get_count, page=page, since_id=last_id)
+            elif self.timeline_type == "public":
+                raw_timeline = self.conn.statuses_public_timeline()
+            elif self.timeline_type == "favourites":
+                raw_timeline = self.conn.favorites(page=page, since_id=last_id)
+            elif self.timeline_type == "search":
+                raw_timeline = self.conn.search(self.type_params['query'], page=page, standardise=True, since_id=last_id, known_ids=[n['id'] for n in timeline], missing=missing)
+            elif self.timeline_type == "context":
+                raw_timeline = []
+                if "conversation_id" in self.type_params:  # try to do it the new way
+                    raw_timeline = self.conn.statusnet_conversation(self.type_params['conversation_id'], count=get_count, since_id=last_id, page=page)
                 else:
-                    self.profile['following'] = "No"
-
-                # create this field specially
-                datetime_joined = helpers.normalise_datetime(self.profile['created_at'])
-                days_since_join = helpers.single_unit(helpers.time_since(datetime_joined), "days")['days']
-                self.profile['notices_per_day'] = "%0.2f" % (float(self.profile['statuses_count']) / days_since_join)
-
-            except StatusNetError, e:
-                if e.errcode == 404:
-                    self.profile = None
-        elif self.timeline_type == "group":
-            raw_timeline = self.conn.statusnet_groups_timeline(group_id=self.type_params['group_id'], nickname=self.type_params['nickname'], count=get_count, page=self.page, since_id=last_id)
-            try:
-                self.profile = self.conn.statusnet_groups_show(nickname=self.type_params['nickname'])
-                # numerical fields, convert them to strings to make the buffer code more clean
-                for field in ['id', 'created', 'member_count']:
-                    self.profile[field] = str(self.profile[field])
-
-            except StatusNetError, e:
-                if e.errcode == 404:
-                    self.profile = None
-        elif self.timeline_type == "tag":
-            raw_timeline = self.conn.statusnet_tags_timeline(tag=self.type_params['tag'], count=get_count, page=self.page, since_id=last_id)
-        elif self.timeline_type == "sentdirect":
-            raw_timeline = self.conn.direct_messages_sent(count=get_count, page=self.page, since_id=last_id)
-        elif self.timeline_type == "public":
-            raw_timeline = self.conn.statuses_public_timeline()
-        elif self.timeline_type == "favourites":
-            raw_timeline = self.conn.favorites(page=self.page, since_id=last_id)
-        elif self.timeline_type == "search":
-            raw_timeline = self.conn.search(self.type_params['query'], page=self.page, standardise=True, since_id=last_id)
-        elif self.timeline_type == "context":
-            raw_timeline = []
-            if "conversation_id" in self.type_params:  # try to do it the new way
-                raw_timeline = self.conn.statusnet_conversation(self.type_params['conversation_id'], count=get_count, since_id=last_id, page=self.page)
-            else:
-                if last_id == 0:  # don't run this if we've already filled the timeline
-                    next_id = self.type_params['notice_id']
-                    while next_id is not None:
-                        notice = self.conn.statuses_show(id=next_id)
-                        raw_timeline.append(notice)
-                        if "retweeted_status" in notice:
-                            next_id = notice['retweeted_status']['id']
-                        else:
-                            next_id = notice['in_reply_to_status_id']
-
-        self.prev_page = self.page
+                    if last_id == 0:  # don't run this if we've already filled the timeline
+                        next_id = self.type_params['notice_id']
+                        while next_id is not None:
+                            notice = self.conn.statuses_show(id=next_id)
+                            raw_timeline.append(notice)
+                            if "retweeted_status" in notice:
+                                next_id = notice['retweeted_status']['id']
+                            else:
+                                next_id = notice['in_reply_to_status_id']
 
         temp_timeline = []
-        old_ids = [n['id'] for n in self.timeline]
+        old_ids = set([n['id'] for n in timeline])
 
         for notice in raw_timeline:
-            notice["ic__raw_datetime"] = helpers.normalise_datetime(notice['created_at'])
+            helpers.stamp_datetime(notice)
             notice["ic__from_web"] = True
             passes_filters = True
             if notice['id'] in old_ids:
@@ -417,6 +716,30 @@ class Timeline(Tab):
                         break
                 temp_timeline.append(notice)
 
+        self.fresh = len(temp_timeline)
+        return page, profile, temp_timeline, missing
+
+    def apply(self, fetched):
+        self.update_name()
+
+        if fetched is None:
+            self.update_buffer()
+            return
+
+        page, profile, temp_timeline, missing = fetched
+        if page != self.page:  # the user turned the page while this was downloading, so it belongs to a page no longer shown
+            return
+        if self.prev_page != page:
+            self.timeline = []
+            self.missing_hits = []
+        self.prev_page = page
+        self.profile = profile
+        self.missing_hits.extend([id for id in missing if not id in self.missing_hits])
+        get_count = config.config['notice_limit']
+
+        old_ids = set([n['id'] for n in self.timeline])
+        temp_timeline = [n for n in temp_timeline if not n['id'] in old_ids]  # another update may have landed since this one set off
+
         if self.timeline_type in ["direct", "mentions"]:  # alert on changes to these. maybe config option later?
             if (len(self.timeline) > 0) and (len(temp_timeline) > 0):  # only fire when there's new stuff _and_ we've already got something in the timeline
                 if config.config['notify'] == 'flash':
@@ -438,7 +761,7 @@ class Timeline(Tab):
         self.update_buffer()
 
     def update_buffer(self):
-        self.buffer.clear()
+        lines = []
 
         if self.timeline_type == "user":
             if self.profile is not None:
@@ -465,12 +788,12 @@ class Timeline(Tab):
 
                         line.append((self.profile[field[1]], identicurse.colour_fields['profile_values']))
 
-                        self.buffer.append(line)
+                        lines.append(self.buffer.clean(line))
 
                     if field[2]:
-                        self.buffer.append([("", identicurse.colour_fields['none'])])
+                        lines.append(self.buffer.clean([("", identicurse.colour_fields['none'])]))
             else:
-                self.buffer.append([("There is no user called @%s on this instance." % (self.type_params['screen_name']), identicurse.colour_fields['none'])])
+                lines.append(self.buffer.clean([("There is no user called @%s on this instance." % (self.type_params['screen_name']), identicurse.colour_fields['none'])]))
 
         if self.timeline_type == "group":
             if self.profile is not None:
@@ -492,231 +815,335 @@ class Timeline(Tab):
 
                         line.append((self.profile[field[1]], identicurse.colour_fields['profile_values']))
 
-                        self.buffer.append(line)
+                        lines.append(self.buffer.clean(line))
 
                     if field[2]:
-                        self.buffer.append([("", identicurse.colour_fields['none'])])
+                        lines.append(self.buffer.clean([("", identicurse.colour_fields['none'])]))
             else:
-                self.buffer.append([("There is no group called !%s on this instance." % (self.type_params['nickname']), identicurse.colour_fields['none'])])
+                lines.append(self.buffer.clean([("There is no group called !%s on this instance." % (self.type_params['nickname']), identicurse.colour_fields['none'])]))
 
-        maxx = self.window.getmaxyx()[1]
-        c = 1
+        if len(self.missing_hits) > 0:
+            lines.append(self.buffer.clean([("%d result(s) could not be fetched: %s" % (len(self.missing_hits), ", ".join([str(id) for id in self.missing_hits])), identicurse.colour_fields['warning'])]))
+            lines.append(self.buffer.clean([("", identicurse.colour_fields['none'])]))
 
-        longest_metadata_string_len = 0
-        for n in self.timeline:
-            if n["text"] is None:
-                n["text"] = ""
-            if "direct" in self.timeline_type:
-                user_string = "%s -> %s" % (n["sender"]["screen_name"], n["recipient"]["screen_name"])
-                source_msg = ""
-            else:
-                atless_reply = False
-                if "in_reply_to_screen_name" in n and n["in_reply_to_screen_name"] is not None:
-                    atless_reply = True
-                    for entity in helpers.split_entities(n["text"]):
-                        if entity["type"] == "user" and entity["text"][1:].lower() == n["in_reply_to_screen_name"].lower():
-                            atless_reply = False
-                            break
-                if atless_reply:
-                    if "user" in n:
-                        user_string = "%s" % (n["user"]["screen_name"])
-                    else:
-                        user_string = "<no username>"
-                    user_string += " -> %s" % (n["in_reply_to_screen_name"])
-                else:
-                    if "user" in n:
-                        user_string = "%s" % (n["user"]["screen_name"])
-                    else:
-                        user_string = ""
-                if (n["source"] == "ostatus") and ("user" in n) and "statusnet_profile_url" in n["user"]:
-                    raw_source_msg = "from %s" % (helpers.domain_regex.findall(n["user"]["statusnet_profile_url"])[0][2])
-                else:
-                    raw_source_msg = "from %s" % (n["source"])
-                source_msg = self.html_regex.sub("", raw_source_msg)
-            if "in_reply_to_status_id" in n and n["in_reply_to_status_id"] is not None:
-                if not config.config["show_source"]:
-                    user_string += " +"
-                else:
-                    source_msg += " [+]"
-            if "retweeted_status" in n:
-                user_string = "%s [%s's RD]" % (n["retweeted_status"]["user"]["screen_name"], n["user"]["screen_name"])
-                if "in_reply_to_status_id" in n["retweeted_status"]:
-                    if not config.config["show_source"]:
-                        user_string += " +"
-                    else:
-                        source_msg += " [+]"
-            datetime_notice = helpers.normalise_datetime(n["created_at"])
-            time_msg = helpers.format_time(helpers.time_since(datetime_notice), short_form=True)
-            metadata_string = time_msg + " " + user_string
-            if config.config["show_source"]:
-                metadata_string += " " + source_msg
-            if len(metadata_string) > longest_metadata_string_len:
-                longest_metadata_string_len = len(metadata_string)
+        maxx = self.window.getmaxyx()[1]
 
+        signature = tuple([config.config[key] for key in ("compact_notices", "show_source", "user_rainbow", "group_rainbow", "tag_rainbow")])
+        if signature != self.render_signature:  # these change what gets cached, so start afresh
+            self.render_cache = {}
+            self.render_signature = signature
+        render_cache = {}
+        rendered = []
         for n in self.timeline:
-            if n["text"] is None:
-                n["text"] = ""
-            from_user = None
-            to_user = None
-            repeating_user = None
-            if "direct" in self.timeline_type:
-                from_user = n["sender"]["screen_name"]
-                to_user = n["recipient"]["screen_name"]
-                source_msg = ""
-            else:
-                if "retweeted_status" in n:
-                    repeating_user = n["user"]["screen_name"]
-                    n = n["retweeted_status"]
-                if "user" in n:
-                    from_user = n["user"]["screen_name"]
-                else:
-                    from_user = "<no username>"
-                atless_reply = False
-                if "in_reply_to_screen_name" in n and n["in_reply_to_screen_name"] is not None:
-                    atless_reply = True
-                    for entity in helpers.split_entities(n["text"]):
-                        if entity["type"] == "user" and entity["text"][1:].lower() == n["in_reply_to_screen_name"].lower():
-                            atless_reply = False
-                            break
-                if atless_reply:
-                    to_user = n["in_reply_to_screen_name"]
-                if (n["source"] == "ostatus") and ("user" in n) and "statusnet_profile_url" in n["user"]:
-                    raw_source_msg = "from %s" % (helpers.domain_regex.findall(n["user"]["statusnet_profile_url"])[0][2])
-                else:
-                    raw_source_msg = "from %s" % (n["source"])
-                source_msg = self.html_regex.sub("", raw_source_msg)
-                repeat_msg = ""
-                if n["in_reply_to_status_id"] is not None:
-                    source_msg += " [+]"
-            datetime_notice = helpers.normalise_datetime(n["created_at"])
+            parts = self.render_cache.get(n["id"])
+            if parts is None or parts["notice"] is not n:  # new, or replaced since it was rendered
+                parts = self.render_notice(n)
+            render_cache[n["id"]] = parts
+            rendered.append(parts)
+        self.render_cache = render_cache  # notices no longer in the timeline drop out here
 
-            time_msg = helpers.format_time(helpers.time_since(datetime_notice), short_form=True)
+        self.notice_epochs = [(parts["meta_epoch"], parts["epoch"]) for parts in rendered]
+        time_msgs = self.relative_times(time.time())
+        self.laid_out_times = time_msgs
 
-            for user in [user for user in [from_user, to_user, repeating_user] if user is not None]:
-                if not user in config.session_store.user_cache:
-                    config.session_store.user_cache[user] = helpers.colour_from_name([item[1] for item in identicurse.base_colours.items()], user.lower())
-           
-            if "ic__paused_on" in n and c != 1:
-                self.buffer.append([("-", identicurse.colour_fields["pause_line"])])
-                self.buffer.append([("", identicurse.colour_fields["none"])])
+        longest_metadata_string_len = 0
+        for parts in rendered:
+            metadata_string_len = len(time_msgs[parts["meta_epoch"]]) + parts["meta_len"]
+            if metadata_string_len > longest_metadata_string_len:
+                longest_metadata_string_len = metadata_string_len
 
-            # Build the line
-            line = []
+        notice_lines = []
+        header_lines = {}
+        c = 1
+        for parts in rendered:
+            time_msg = time_msgs[parts["epoch"]]
+            paused = "ic__paused_on" in parts["shown"] and c != 1
+            layout = (len(count_text(c)), len(time_msg), maxx, paused, config.config["show_notice_links"])
+            if config.config['compact_notices']:
+                layout += (longest_metadata_string_len,)
+            if parts.get("layout") != layout:  # display() draws the number and time over the buffer, so only their lengths matter
+                self.lay_out(parts, c, time_msg, maxx, longest_metadata_string_len, paused)
+                parts["layout"] = layout
+            notice_lines.append((len(lines) + parts["first_line"], len(lines) + parts["last_line"]))
+            if parts["header_line"] is not None:
+                header_lines[len(lines) + parts["header_line"]] = c - 1
+            lines.extend(parts["lines"])
+            c += 1
 
-            if c < 10:
-                cout = " " + str(c)
-            else:
-                cout = str(c)
-            line.append((cout, identicurse.colour_fields["notice_count"]))
+        self.buffer.patch(lines)  # lines of notices that were already there are the same objects, so only new and removed ones are touched
+        self.notice_lines = notice_lines
+        self.header_lines = header_lines
 
-            if (c - 1) == self.chosen_one:
-                line.append((' * ', identicurse.colour_fields["selector"]))
-            else:
-                line.append((' ' * 3, identicurse.colour_fields["selector"]))
+    def lay_out(self, parts, c, time_msg, maxx, longest_metadata_string_len, paused):
+        """ Build the buffer lines for the notice in parts as number c, and note which of them are its own and which has its number on. """
+        lines = []
+        user_length = parts["user_length"]
+        source_msg = parts["source_msg"]
 
-            if config.config['compact_notices']:
-                line.append((time_msg, identicurse.colour_fields["time"]))
-                line.append((" ", identicurse.colour_fields["none"]))
+        if paused:
+            lines.append(self.buffer.clean([("-", identicurse.colour_fields["pause_line"])]))
+            lines.append(self.buffer.clean([("", identicurse.colour_fields["none"])]))
 
-            if config.config['user_rainbow']:
-                line.append((from_user, config.session_store.user_cache[from_user]))
-            else:
-                line.append((from_user, identicurse.colour_fields["username"]))
-            if from_user is not None:
-                user_length = len(from_user)
-            else:
-                user_length = None
+        # Build the line
+        cout = count_text(c)
+        line = [(cout, identicurse.colour_fields["notice_count"], 0)]
 
-            if to_user is not None:
-                line.append((" -> ", identicurse.colour_fields["none"]))
-                if config.config['user_rainbow']:
-                    line.append((to_user, config.session_store.user_cache[to_user]))
-                else:
-                    line.append((to_user, identicurse.colour_fields["username"]))
-                user_length += len(" -> ") + len(to_user)
+        line.append((' ' * 3, identicurse.colour_fields["selector"], 0))  # display() draws the selector over this
 
-            if repeating_user is not None:
-                if config.config["compact_notices"]:
-                    line.append((" [", identicurse.colour_fields["none"]))
-                else:
-                    line.append((" [ repeat by ", identicurse.colour_fields["none"]))
+        if config.config['compact_notices']:
+            line.append((time_msg, identicurse.colour_fields["time"], 0))
+            line.append((" ", identicurse.colour_fields["none"], 0))
 
-                if config.config['user_rainbow']:
-                    line.append((repeating_user, config.session_store.user_cache[repeating_user]))
-                else:
-                    line.append((repeating_user, identicurse.colour_fields["username"]))
+        line.extend(parts["users"])
 
-                if config.config["compact_notices"]:
-                    line.append(("'s RD]", identicurse.colour_fields["none"]))
-                    user_length += len(" [") + len(repeating_user) + len("'s RD]")
+        first_line = header_line = len(lines)
+        if not config.config['compact_notices']:
+            if config.config["show_source"]:
+                line.append((' ' * (maxx - ((len(source_msg) + len(time_msg) + user_length + (6 + len(cout))))), identicurse.colour_fields["none"], 0))
+            else:
+                line.append((' ' * (maxx - ((len(time_msg) + user_length + (5 + len(cout))))), identicurse.colour_fields["none"], 0))
+            line.append((time_msg, identicurse.colour_fields["time"], 0))
+            if config.config["show_source"]:
+                line.append((' ', identicurse.colour_fields["none"], 0))
+                line.extend(parts["source"])
+            lines.append(line)
+            line = []
+            min_x_offset = 0
+        else:
+            if config.config["show_source"]:
+                line.extend(parts["spaced_source"])
+                padding = longest_metadata_string_len - (user_length + len(time_msg) + len(source_msg) + 2)
+                metadata_len = 1 + len(source_msg)
+            else:
+                line.append((" %s" % (parts["detail_char"]), identicurse.colour_fields["source"], 0))
+                if parts["detail_char"] == "":
+                    line.append((" ", identicurse.colour_fields["none"], 0))
+                padding = longest_metadata_string_len - (user_length + len(time_msg) + 1)
+                metadata_len = 2
+            line.append((" "*padding, identicurse.colour_fields["none"], 0))
+            line.append((" | ", identicurse.colour_fields["none"], 0))
+            min_x_offset = len(cout) + 3 + len(time_msg) + 1 + user_length + metadata_len + max(padding, 0) + 3  # how far along the line the notice text begins, so wrapped lines get the same indentation
+
+        if parts["body"] is not None:
+            if not min_x_offset in parts["body_at"]:
+                parts["body_at"][min_x_offset] = [(block[0], block[1], min_x_offset) for block in parts["body"]]
+            lines.append(line + parts["body_at"][min_x_offset])
+        else:
+            if len(line) > 0:  # in compact mode the header goes too, as it always has
+                first_line = len(lines)
+                header_line = None
+            lines.append(self.buffer.clean([("Caution: Terminal too shit to display this notice.", identicurse.colour_fields["warning"])]))
+
+        if config.config["show_notice_links"]:
+            lines.append(parts["link"])
+
+        parts["first_line"], parts["last_line"] = first_line, len(lines) - 1
+
+        if not config.config['compact_notices']:
+            lines.append([])
+
+        parts["lines"] = lines
+        parts["header_line"] = header_line
+
+    def notice_at(self, line):
+        return self.header_lines.get(line)
+
+    def relative_times(self, now):
+        """ Work out every notice's time as of now, and when the first of them will change. """
+        times = {}
+        change_at = None
+        for epochs in self.notice_epochs:
+            for epoch in epochs:
+                if not epoch in times:
+                    times[epoch], epoch_change_at = helpers.relative_time(epoch, now)
+                    if change_at is None or epoch_change_at < change_at:
+                        change_at = epoch_change_at
+        self.times = times
+        self.times_change_at = change_at
+        return times
+
+    def refresh_times(self):
+        """ Bring the times up to date. The buffer is only rebuilt if one changed length, since the layout depends on that. """
+        if self.times_change_at is None or time.time() < self.times_change_at:
+            return
+        times = self.relative_times(time.time())
+        for epoch in times:
+            if len(times[epoch]) != len(self.laid_out_times.get(epoch, "")):
+                self.update_buffer()
+                return
+
+    def shown_time(self, notice, laid_out):
+        if notice < len(self.notice_epochs):
+            time_msg = self.times.get(self.notice_epochs[notice][1], laid_out)
+            if len(time_msg) == len(laid_out):  # anything else needs the buffer rebuilding first
+                return time_msg
+        return laid_out
+
+    def render_notice(self, n):
+        """ Build the parts of n's lines that stay the same wherever it sits in the timeline. """
+        parts = {"notice": n, "body_at": {}}
+        if n["text"] is None:
+            n["text"] = ""
+
+        # the metadata compact notices are lined up on
+        if "direct" in self.timeline_type:
+            user_string = "%s -> %s" % (n["sender"]["screen_name"], n["recipient"]["screen_name"])
+            source_msg = ""
+        else:
+            atless_reply = False
+            if "in_reply_to_screen_name" in n and n["in_reply_to_screen_name"] is not None:
+                atless_reply = True
+                for entity in helpers.split_entities(n["text"]):
+                    if entity["type"] == "user" and entity["text"][1:].lower() == n["in_reply_to_screen_name"].lower():
+                        atless_reply = False
+                        break
+            if atless_reply:
+                if "user" in n:
+                    user_string = "%s" % (n["user"]["screen_name"])
                 else:
-                    line.append((" ]", identicurse.colour_fields["none"]))
-                    user_length += len(" [ repeat by ") + len(repeating_user) + len(" ]")
-
-            if not config.config['compact_notices']:
-                if config.config["show_source"]:
-                    line.append((' ' * (maxx - ((len(source_msg) + len(time_msg) + user_length + (6 + len(cout))))), identicurse.colour_fields["none"]))
+                    user_string = "<no username>"
+                user_string += " -> %s" % (n["in_reply_to_screen_name"])
+            else:
+                if "user" in n:
+                    user_string = "%s" % (n["user"]["screen_name"])
                 else:
-                    line.append((' ' * (maxx - ((len(time_msg) + user_length + (5 + len(cout))))), identicurse.colour_fields["none"]))
-                line.append((time_msg, identicurse.colour_fields["time"]))
-                if config.config["show_source"]:
-                    line.append((' ', identicurse.colour_fields["none"]))
-                    line.append((source_msg, identicurse.colour_fields["source"]))
-                self.buffer.append(line)
-                line = []
+                    user_string = ""
+            if (n["source"] == "ostatus") and ("user" in n) and "statusnet_profile_url" in n["user"]:
+                raw_source_msg = "from %s" % (helpers.domain_regex.findall(n["user"]["statusnet_profile_url"])[0][2])
+            else:
+                raw_source_msg = "from %s" % (n["source"])
+            source_msg = self.html_regex.sub("", raw_source_msg)
+        if "in_reply_to_status_id" in n and n["in_reply_to_status_id"] is not None:
+            if not config.config["show_source"]:
+                user_string += " +"
             else:
-                detail_char = ""
-                if (not config.config["show_source"]):
-                    if "in_reply_to_status_id" in n and n["in_reply_to_status_id"] is not None:
-                        detail_char = "+"
-                    elif "retweeted_status" in n:
-                        detail_char = "~"
-                    line.append((" %s" % (detail_char), identicurse.colour_fields["source"]))
-                if config.config["show_source"]:
-                        line.append((" " + source_msg, identicurse.colour_fields["source"]))
-                        line.append((" "*((longest_metadata_string_len - (user_length + len(time_msg) + len(source_msg) + 2))), identicurse.colour_fields["none"]))
+                source_msg += " [+]"
+        if "retweeted_status" in n:
+            user_string = "%s [%s's RD]" % (n["retweeted_status"]["user"]["screen_name"], n["user"]["screen_name"])
+            if "in_reply_to_status_id" in n["retweeted_status"]:
+                if not config.config["show_source"]:
+                    user_string += " +"
                 else:
-                    if detail_char == "":
-                        line.append((" ", identicurse.colour_fields["none"]))
-                    line.append((" "*((longest_metadata_string_len - (user_length + len(time_msg) + 1))), identicurse.colour_fields["none"]))
-                line.append((" | ", identicurse.colour_fields["none"]))
-
-            try:
-                min_x_offset = reduce((lambda acc_length, block: (acc_length if (len(block) < 3) else max(acc_length, block[2])) + len(block[0])), line, 0)  # determine how far along the line items beginning now would be; this will be used so that wrapped lines get correct indentation
-                notice_entities = helpers.split_entities(n['text'] or "")
-                for entity in notice_entities:
-                    if len(entity['text']) > 0:
-                        if entity['type'] in ['user', 'group', 'tag']:
-                            entity_text_no_symbol = entity['text'][1:]
-                            cache = getattr(config.session_store, '%s_cache' % (entity['type']))
-                            if not entity_text_no_symbol in cache:
-                                cache[entity_text_no_symbol] = helpers.colour_from_name([item[1] for item in identicurse.base_colours.items()], entity_text_no_symbol.lower())
-                            if config.config['%s_rainbow' % (entity['type'])]:
-                                line.append((entity['text'], cache[entity_text_no_symbol], min_x_offset))
-                            else:
-                                if entity['type'] == "user":
-                                    line.append((entity['text'], identicurse.colour_fields["username"], min_x_offset))
-                                else:
-                                    line.append((entity['text'], identicurse.colour_fields[entity['type']], min_x_offset))
-                        else:
-                            line.append((entity['text'], identicurse.colour_fields["notice"], min_x_offset))
+                    source_msg += " [+]"
+        parts["meta_epoch"] = helpers.notice_epoch(n)
+        parts["meta_len"] = 1 + len(user_string)  # the rest of the metadata, after the time
+        if config.config["show_source"]:
+            parts["meta_len"] += 1 + len(source_msg)
+
+        # and what is actually shown
+        from_user = None
+        to_user = None
+        repeating_user = None
+        if "direct" in self.timeline_type:
+            from_user = n["sender"]["screen_name"]
+            to_user = n["recipient"]["screen_name"]
+            source_msg = ""
+        else:
+            if "retweeted_status" in n:
+                repeating_user = n["user"]["screen_name"]
+                n = n["retweeted_status"]
+            if "user" in n:
+                from_user = n["user"]["screen_name"]
+            else:
+                from_user = "<no username>"
+            atless_reply = False
+            if "in_reply_to_screen_name" in n and n["in_reply_to_screen_name"] is not None:
+                atless_reply = True
+                for entity in helpers.split_entities(n["text"]):
+                    if entity["type"] == "user" and entity["text"][1:].lower() == n["in_reply_to_screen_name"].lower():
+                        atless_reply = False
+                        break
+            if atless_reply:
+                to_user = n["in_reply_to_screen_name"]
+            if (n["source"] == "ostatus") and ("user" in n) and "statusnet_profile_url" in n["user"]:
+                raw_source_msg = "from %s" % (helpers.domain_regex.findall(n["user"]["statusnet_profile_url"])[0][2])
+            else:
+                raw_source_msg = "from %s" % (n["source"])
+            source_msg = self.html_regex.sub("", raw_source_msg)
+            if n["in_reply_to_status_id"] is not None:
+                source_msg += " [+]"
+        parts["shown"] = n
+        parts["epoch"] = helpers.notice_epoch(n)
+
+        for user in [user for user in [from_user, to_user, repeating_user] if user is not None]:
+            if not user in config.session_store.user_cache:
+                config.session_store.user_cache[user] = helpers.colour_from_name([item[1] for item in identicurse.base_colours.items()], user.lower())
+
+        line = []
+        if config.config['user_rainbow']:
+            line.append((from_user, config.session_store.user_cache[from_user]))
+        else:
+            line.append((from_user, identicurse.colour_fields["username"]))
+        if from_user is not None:
+            user_length = len(from_user)
+        else:
+            user_length = None
 
-                self.buffer.append(line)
+        if to_user is not None:
+            line.append((" -> ", identicurse.colour_fields["none"]))
+            if config.config['user_rainbow']:
+                line.append((to_user, config.session_store.user_cache[to_user]))
+            else:
+                line.append((to_user, identicurse.colour_fields["username"]))
+            user_length += len(" -> ") + len(to_user)
 
-            except UnicodeDecodeError:
-                self.buffer.append([("Caution: Terminal too shit to display this notice.", identicurse.colour_fields["warning"])])
+        if repeating_user is not None:
+            if config.config["compact_notices"]:
+                line.append((" [", identicurse.colour_fields["none"]))
+            else:
+                line.append((" [ repeat by ", identicurse.colour_fields["none"]))
 
-            if config.config["show_notice_links"]:
-                line = []
-                base_url = helpers.base_url_regex.findall(self.conn.api_path)[0][0]
-                if self.timeline_type in ["direct", "sentdirect"]:
-                    notice_link = "%s/message/%s" % (base_url, str(n["id"]))
-                else:
-                    notice_link = "%s/notice/%s" % (base_url, str(n["id"]))
-                line.append(("<%s>" % (notice_link), identicurse.colour_fields["notice_link"]))
-                self.buffer.append(line)
+            if config.config['user_rainbow']:
+                line.append((repeating_user, config.session_store.user_cache[repeating_user]))
+            else:
+                line.append((repeating_user, identicurse.colour_fields["username"]))
 
-            if not config.config['compact_notices']:
-                self.buffer.append([])
+            if config.config["compact_notices"]:
+                line.append(("'s RD]", identicurse.colour_fields["none"]))
+                user_length += len(" [") + len(repeating_user) + len("'s RD]")
+            else:
+                line.append((" ]", identicurse.colour_fields["none"]))
+                user_length += len(" [ repeat by ") + len(repeating_user) + len(" ]")
+        parts["users"] = self.buffer.clean(line)
+        parts["user_length"] = user_length
+        parts["source_msg"] = source_msg
+        parts["source"] = self.buffer.clean([(source_msg, identicurse.colour_fields["source"])])
+        parts["spaced_source"] = self.buffer.clean([(" " + source_msg, identicurse.colour_fields["source"])])
+
+        parts["detail_char"] = ""
+        if "in_reply_to_status_id" in n and n["in_reply_to_status_id"] is not None:
+            parts["detail_char"] = "+"
+        elif "retweeted_status" in n:
+            parts["detail_char"] = "~"
+
+        try:
+            line = []
+            notice_entities = helpers.split_entities(n['text'] or "")
+            for entity in notice_entities:
+                if len(entity['text']) > 0:
+                    if entity['type'] in ['user', 'group', 'tag']:
+                        entity_text_no_symbol = entity['text'][1:]
+                        cache = getattr(config.session_store, '%s_cache' % (entity['type']))
+                        if not entity_text_no_symbol in cache:
+                            cache[entity_text_no_symbol] = helpers.colour_from_name([item[1] for item in identicurse.base_colours.items()], entity_text_no_symbol.lower())
+                        if config.config['%s_rainbow' % (entity['type'])]:
+                            line.append((entity['text'], cache[entity_text_no_symbol]))
+                        else:
+                            if entity['type'] == "user":
+                                line.append((entity['text'], identicurse.colour_fields["username"]))
+                            else:
+                                line.append((entity['text'], identicurse.colour_fields[entity['type']]))
+                    else:
+                        line.append((entity['text'], identicurse.colour_fields["notice"]))
+            parts["body"] = self.buffer.clean(line)
+        except UnicodeDecodeError:
+            parts["body"] = None
+
+        base_url = helpers.base_url_regex.findall(self.conn.api_path)[0][0]
+        if self.timeline_type in ["direct", "sentdirect"]:
+            notice_link = "%s/message/%s" % (base_url, str(n["id"]))
+        else:
+            notice_link = "%s/notice/%s" % (base_url, str(n["id"]))
+        parts["link"] = self.buffer.clean([("<%s>" % (notice_link), identicurse.colour_fields["notice_link"])])
 
-            c += 1
+        return parts
@@ -15,7 +15,8 @@
 # You should have received a copy of the GNU General Public License 
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import urllib, urllib2, httplib, time, re, ssl
+import urllib, urlparse, httplib, socket, select, errno, threading, contextlib, itertools, heapq, random, math, sys, os, time, re, ssl, zlib, hmac, hashlib, base64, binascii
+from collections import OrderedDict, deque
 
 try:
     from oauthlib import oauth1
@@ -29,6 +30,18 @@ except ImportError:
 
 
 domain_regex = re.compile("http(s|)://(www\.|)(.+?)(/.*|)$")
+whitespace_regex = re.compile("[ \t\n\r]*")
+endpoint_regex = re.compile("^(statuses/show|statuses/retweet|favorites/create|favorites/destroy|statusnet/groups/[a-z_]+|statusnet/tags/timeline|statusnet/conversation)/.+$")
+
+
+def endpoint_name(resource_path):
+    """ Collapse a resource path into the endpoint it belongs to, so e.g. every statuses/show/<id> is counted together. """
+    if resource_path.endswith(".json"):
+        resource_path = resource_path[:-5]
+    match = endpoint_regex.match(resource_path)
+    if match is not None:
+        return match.group(1)
+    return resource_path
 
 
 def find_split_point(text, width):
@@ -47,6 +60,155 @@ def find_split_point(text, width):
     return split_point
 
 
+def run_concurrently(function, args_list, max_workers=4):
+    """ Call function(*args) for every args tuple in args_list on at most max_workers threads. Returns (result, exc_info) pairs in input order. """
+    results = [None] * len(args_list)
+    next_index = [0]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                index = next_index[0]
+                next_index[0] += 1
+            if index >= len(args_list):
+                return
+            try:
+                results[index] = (function(*args_list[index]), None)
+            except:
+                results[index] = (None, sys.exc_info())
+
+    workers = [threading.Thread(target=worker) for i in xrange(min(max_workers, len(args_list)))]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results
+
+
+def outcome_results(outcomes):
+    """ The results from (result, exc_info) outcomes, re-raising the first failure among them. """
+    results = []
+    for result, exc_info in outcomes:
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        results.append(result)
+    return results
+
+
+def oauth_escape(value):
+    """ Percent-encode value the way OAuth 1 signatures require. """
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return urllib.quote(value, safe="~")
+
+
+class BackgroundCall(threading.Thread):
+    """ Runs function() on a thread of its own. result() waits for it, then returns its value or re-raises its exception. """
+    def __init__(self, function):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.function = function
+        self.value = None
+        self.exc_info = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.function()
+        except:
+            self.exc_info = sys.exc_info()
+
+    def result(self):
+        self.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+
+def iter_json_array(chunks):
+    """ Yield each element of the JSON array arriving in chunks as soon as all of it is in, keeping only the unparsed remainder. A body that isn't an array is yielded whole at the end. """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer, position = "", 0
+    started = False
+    while True:
+        position = whitespace_regex.match(buffer, position).end()
+        if position < len(buffer):
+            if not started:
+                if buffer[position] != "[":  # e.g. an error object, which there's no point streaming
+                    yield json.loads(buffer[position:] + "".join(chunks))
+                    return
+                started = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            if buffer[position] == ",":
+                position += 1
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:  # the rest of this element hasn't arrived yet
+                pass
+            else:
+                following = whitespace_regex.match(buffer, end).end()
+                if following < len(buffer) and buffer[following] in ",]":  # only trust it once its delimiter is in, as a number could still be growing
+                    yield item
+                    position = end
+                    continue
+        chunk = next(chunks, None)
+        if chunk is None:
+            if started or position < len(buffer):
+                raise ValueError("Response ended partway through a JSON array")
+            return  # an empty body
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def wanted_ids(ids, known_ids=()):
+    """ The ids from ids not in known_ids, in order and without duplicates. """
+    known_ids = set(known_ids)
+    wanted = []
+    for id in ids:
+        if not id in known_ids and not id in wanted:
+            wanted.append(id)
+    return wanted
+
+
+def json_copy(value):
+    """ Copy a parsed JSON value all the way down, so nested dicts such as a notice's user aren't shared. Quicker than copy.deepcopy, as only dicts and lists need copying. """
+    if isinstance(value, dict):
+        return dict([(key, json_copy(item)) for (key, item) in value.iteritems()])
+    if isinstance(value, list):
+        return [json_copy(item) for item in value]
+    return value
+
+
+def hydrated_pairs(ids, outcomes):
+    """ Pair each id with its fetched notice or profile from (result, exc_info) outcomes, using None for those which have gone missing. """
+    hydrated = []
+    for id, (item, exc_info) in zip(ids, outcomes):
+        if exc_info is not None:
+            if isinstance(exc_info[1], StatusNetError) and 400 <= exc_info[1].errcode < 500:  # deleted or hidden since it was referred to
+                item = None
+            else:
+                raise exc_info[0], exc_info[1], exc_info[2]
+        hydrated.append((id, item))
+    return hydrated
+
+
+def trimmed_users(notices):
+    """ The user objects in notices (and in their repeated notices) which came back as only an id, as trim_user asks. """
+    stubs = []
+    for notice in notices:
+        for shown in (notice, isinstance(notice, dict) and notice.get("retweeted_status")):
+            if isinstance(shown, dict) and isinstance(shown.get("user"), dict) and not "screen_name" in shown["user"]:
+                stubs.append(shown["user"])
+    return stubs
+
+
 class StatusNetError(Exception):
     def __init__(self, errcode, details):
         self.errcode = errcode
@@ -56,9 +218,679 @@ class StatusNetError(Exception):
         else:
             Exception.__init__(self, "Error %d: %s" % (self.errcode, self.details))
 
+
+class CircuitOpenError(StatusNetError):
+    def __init__(self, host, retry_in):
+        self.host = host
+        self.retry_in = retry_in
+        StatusNetError.__init__(self, -1, "%s is degraded, retrying in %ds" % (host, retry_in))
+
+
+class RateLimitedError(StatusNetError):
+    def __init__(self, retry_in):
+        self.retry_in = retry_in
+        StatusNetError.__init__(self, -1, "Rate limit reached, next poll in %ds" % (retry_in))
+
+
+class RateLimiter(object):
+    """ Tracks the remaining API quota and spaces polling cycles out so they fit within it, always letting interactive calls go first. """
+    def __init__(self, reserve=10, max_wait=30.0, recheck_interval=300.0):
+        self.reserve = reserve  # hits kept back for interactive calls
+        self.max_wait = max_wait
+        self.recheck_interval = recheck_interval
+        self.remaining = None
+        self.limit = None
+        self.reset_at = None
+        self.checked_at = None
+        self.from_headers = False  # X-RateLimit-* headers are always believed
+        self.status_remaining = None  # remaining_hits as rate_limit_status last gave it
+        self.last_cycle = 0
+        self.interactive_pending = 0
+        self.pending_poll = 0.5  # how often try_acquire callers should check back while interactive calls are in flight
+        self.condition = threading.Condition()
+
+    def update(self, remaining, limit, reset_at):
+        with self.condition:
+            self.remaining = remaining
+            self.limit = limit
+            self.reset_at = reset_at
+            self.checked_at = time.time()
+            self.condition.notify_all()
+
+    def update_from_headers(self, response):
+        remaining = response.getheader("x-ratelimit-remaining")
+        if remaining is None:
+            return
+        try:
+            limit = response.getheader("x-ratelimit-limit")
+            reset_at = response.getheader("x-ratelimit-reset")
+            self.update(int(remaining), limit and int(limit), reset_at and int(reset_at))
+            self.from_headers = True
+        except ValueError:
+            pass
+
+    def update_from_status(self, status):
+        try:
+            remaining, limit, reset_at = int(status["remaining_hits"]), int(status["hourly_limit"]), int(status["reset_time_in_seconds"])
+        except (KeyError, TypeError, ValueError):  # not a rate_limit_status we understand, so rely on response headers alone
+            self.update(None, None, None)
+            return
+        previous, self.status_remaining = self.status_remaining, remaining
+        if self.from_headers or (previous is not None and remaining < previous):
+            self.update(remaining, limit, reset_at)
+        else:  # stock StatusNet answers with a fixed 150 an hour that never goes down, so only pace on it once it has been seen to
+            self.update(None, None, None)
+
+    def needs_refresh(self):
+        now = time.time()
+        if self.checked_at is None:
+            return True
+        return (self.reset_at is None or now >= self.reset_at) and (now - self.checked_at >= self.recheck_interval)
+
+    def background_delay(self):  # a background call only waits once the quota is down to the reserve; spacing is done a cycle at a time, by try_cycle
+        if self.remaining is None or self.reset_at is None:  # no idea what the quota is, so don't hold anything back
+            return 0
+        window = self.reset_at - time.time()
+        if window <= 0 or self.remaining > self.reserve:
+            return 0
+        return window
+
+    def try_cycle(self, hits):  # returns 0 once a polling cycle of about hits background calls may start, and counts it as started, otherwise how long to hold the whole cycle back
+        with self.condition:
+            delay = 0
+            if self.remaining is not None and self.reset_at is not None:
+                now = time.time()
+                window = self.reset_at - now
+                spare = self.remaining - self.reserve
+                if window > 0:
+                    if spare < hits:
+                        delay = window
+                    else:
+                        delay = max(0, self.last_cycle + window * hits / spare - now)
+            if delay == 0:
+                self.last_cycle = time.time()
+            return delay
+
+    def acquire(self, background):
+        with self.condition:
+            if not background:
+                self.interactive_pending += 1
+            else:
+                deadline = time.time() + self.max_wait
+                while True:
+                    if self.interactive_pending > 0:
+                        delay = deadline - time.time()
+                    else:
+                        delay = self.background_delay()
+                        if delay <= 0:
+                            break
+                    if time.time() + delay > deadline:
+                        raise RateLimitedError(max(delay, 1))
+                    self.condition.wait(delay)
+            if self.remaining is not None:
+                self.remaining -= 1
+
+    def try_acquire(self, background):  # non-blocking acquire: returns 0 once the request may go ahead, otherwise how long to wait before asking again
+        with self.condition:
+            if not background:
+                self.interactive_pending += 1
+            else:
+                if self.interactive_pending > 0:
+                    return self.pending_poll
+                delay = self.background_delay()
+                if delay > 0:
+                    return delay
+            if self.remaining is not None:
+                self.remaining -= 1
+            return 0
+
+    def release(self, background):
+        if not background:
+            with self.condition:
+                self.interactive_pending -= 1
+                self.condition.notify_all()
+
+
+class RetryPolicy(object):
+    """ Exponential backoff with full jitter, limited to a number of attempts and a total time budget per call. """
+    def __init__(self, attempts=4, base_delay=0.5, max_delay=8.0, budget=15.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def delay(self, attempt, retry_after=None):
+        if retry_after is not None:  # honour the server's own estimate where it gives one in seconds
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker(object):
+    """ Refuses requests to a host for a cooling-off period after several consecutive failures, so a struggling server isn't hammered by every tab. """
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=300.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0
+        self.lock = threading.Lock()
+
+    def retry_in(self):
+        return max(0, self.open_until - time.time())
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.trips = 0
+            self.open_until = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                cooldown = min(self.max_cooldown, self.cooldown * (2 ** self.trips)) * random.uniform(0.8, 1.2)
+                self.open_until = time.time() + cooldown
+                self.trips += 1
+                self.failures = self.failure_threshold - 1  # once the cooldown is over, a single further failure re-opens the circuit
+
+
+class PooledResponse(object):
+    """ Wraps an httplib response, handing its connection back to the pool once the body has been read. """
+    def __init__(self, pool, key, conn, response):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.status = response.status
+        self.reason = response.reason
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def read(self, amt=None):
+        try:
+            data = self.response.read(amt)
+        except:
+            self.close()
+            raise
+        if amt is None or data == "":
+            self.release()
+        return data
+
+    def release(self):
+        if self.conn is None:
+            return
+        if self.response.isclosed() and not self.response.will_close:
+            self.pool.put(self.key, self.conn)
+        else:  # body wasn't fully read or the server wants to close, so the connection can't be reused
+            self.conn.close()
+        self.conn = None
+
+    def close(self):
+        self.response.close()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def socket_dropped(sock):
+    """ True if the server has closed (or written to) an idle socket, so a request sent on it would be lost. """
+    try:
+        readable = select.select([sock], [], [], 0)[0]
+    except (select.error, socket.error, ValueError):
+        return True
+    return len(readable) > 0
+
+
+class ConnectionPool(object):
+    """ Keeps a few persistent HTTP/1.1 connections open per host, so that requests don't each pay for a fresh TCP and TLS handshake. """
+    redirect_codes = (301, 302, 303, 307)
+
+    def __init__(self, validate_ssl=True, max_idle_per_host=4, timeout=60):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        if validate_ssl:
+            self.ssl_context = ssl.create_default_context()
+        else:
+            self.ssl_context = ssl._create_unverified_context()
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.proxies = urllib.getproxies()  # http_proxy, https_proxy and friends, as urllib2's ProxyHandler would have used
+
+    def proxy(self, scheme, netloc):
+        """ Return (host:port, headers) of the proxy to reach netloc through, or None to connect directly. """
+        proxy_url = self.proxies.get(scheme)
+        if proxy_url is None or urllib.proxy_bypass(netloc.split(":")[0]):
+            return None
+        if not "://" in proxy_url:
+            proxy_url = "http://" + proxy_url
+        proxy = urlparse.urlsplit(proxy_url)
+        headers = {}
+        if proxy.username is not None:
+            credentials = "%s:%s" % (urllib.unquote(proxy.username), urllib.unquote(proxy.password or ""))
+            headers["Proxy-Authorization"] = "Basic " + base64.b64encode(credentials)
+        return proxy.netloc.split("@")[-1], headers
+
+    def get(self, key):
+        while True:
+            with self.lock:
+                if len(self.idle.get(key, [])) == 0:
+                    break
+                conn = self.idle[key].pop()
+            if conn.sock is not None and socket_dropped(conn.sock):  # caught before anything is written, so even a POST can go on a fresh one
+                conn.close()
+                continue
+            return conn, True
+        scheme, netloc = key
+        proxy = self.proxy(scheme, netloc)
+        if scheme == "https":
+            if proxy is not None:  # tunnel through with CONNECT, so TLS still runs end to end
+                conn = httplib.HTTPSConnection(proxy[0], timeout=self.timeout, context=self.ssl_context)
+                conn.set_tunnel(netloc, headers=proxy[1])
+            else:
+                conn = httplib.HTTPSConnection(netloc, timeout=self.timeout, context=self.ssl_context)
+        else:
+            conn = httplib.HTTPConnection((proxy or (netloc,))[0], timeout=self.timeout)
+        return conn, False
+
+    def put(self, key, conn):
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                for conn in idle:
+                    conn.close()
+            self.idle = {}
+
+    def request(self, method, url, body=None, headers={}, redirects=5):
+        headers = dict((str(key), str(value)) for (key, value) in headers.items())
+        if body is not None:
+            body = str(body)
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(str(url))
+        if query != "":
+            path = "%s?%s" % (path, query)
+        key = (scheme, netloc)
+        target, sent_headers = path or "/", headers
+        proxy = self.proxy(scheme, netloc)
+        if scheme == "http" and proxy is not None:  # a plain HTTP proxy wants the whole URL on the request line
+            target = "%s://%s%s" % (scheme, netloc, target)
+            sent_headers = dict(headers, **proxy[1])
+        while True:
+            conn, reused = self.get(key)
+            try:
+                conn.request(method, target, body, sent_headers)
+                response = conn.getresponse()
+            except socket.timeout:
+                conn.close()
+                raise
+            except (httplib.BadStatusLine, httplib.CannotSendRequest, socket.error):
+                conn.close()
+                if reused and method == "GET":  # the server dropped this idle connection, so retry on another one; a POST might already have been acted on
+                    continue
+                raise
+            break
+        response = PooledResponse(self, key, conn, response)
+
+        location = response.getheader("location")
+        if response.status in self.redirect_codes and location is not None and redirects > 0:  # follow redirects the same way urllib2 would
+            if method == "POST" and response.status == 307:
+                return response
+            response.read()
+            if method == "POST":
+                method, body = "GET", None
+                headers = dict((key, value) for (key, value) in headers.items() if not key.lower().startswith("content-"))
+            return self.request(method, urlparse.urljoin(url, location), body, headers, redirects - 1)
+        return response
+
+
+class ContentDecoder(object):
+    """ Incrementally decodes a gzip/deflate response body, counting bytes on both sides of the decompression. """
+    def __init__(self, content_encoding=None):
+        self.encoding = (content_encoding or "identity").strip().lower()
+        if self.encoding in ("gzip", "x-gzip"):
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == "deflate":
+            self.decompressor = zlib.decompressobj()
+        else:
+            self.decompressor = None
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+
+    def decode(self, chunk):
+        self.compressed_bytes += len(chunk)
+        if self.decompressor is None:
+            data = chunk
+        else:
+            try:
+                data = self.decompressor.decompress(chunk)
+            except zlib.error:
+                if self.encoding == "deflate" and self.compressed_bytes == len(chunk):  # some servers send raw deflate without the zlib header
+                    self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                    data = self.decompressor.decompress(chunk)
+                else:
+                    raise
+        self.decompressed_bytes += len(data)
+        return data
+
+    def flush(self):
+        if self.decompressor is None:
+            return ""
+        data = self.decompressor.flush()
+        self.decompressed_bytes += len(data)
+        return data
+
+
+class TransferStats(object):
+    """ Per-endpoint totals of bytes received on the wire versus bytes after decompression. """
+    def __init__(self):
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, compressed_bytes, decompressed_bytes):
+        with self.lock:
+            totals = self.totals.setdefault(endpoint, {"compressed": 0, "decompressed": 0})
+            totals["compressed"] += compressed_bytes
+            totals["decompressed"] += decompressed_bytes
+
+    def snapshot(self):
+        with self.lock:
+            return dict((endpoint, totals.copy()) for (endpoint, totals) in self.totals.items())
+
+
+class RequestMetrics(object):
+    """ Per-endpoint request counts, latency percentiles, bytes sent, retries, BadStatusLines and error codes. """
+    latency_samples = 1000  # recent latencies kept per endpoint for the percentiles
+
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def __endpoint(self, endpoint):  # the caller must hold the lock
+        if not endpoint in self.endpoints:
+            self.endpoints[endpoint] = {"count": 0, "latencies": deque(maxlen=self.latency_samples), "bytes_out": 0, "retries": 0, "bad_status_lines": 0, "errors": {}}
+        return self.endpoints[endpoint]
+
+    def record(self, endpoint, latency, error=None):  # one per call, however many attempts it took
+        with self.lock:
+            metrics = self.__endpoint(endpoint)
+            metrics["count"] += 1
+            metrics["latencies"].append(latency)
+            if error is not None:
+                metrics["errors"][error] = metrics["errors"].get(error, 0) + 1
+
+    def record_sent(self, endpoint, sent_bytes):
+        with self.lock:
+            self.__endpoint(endpoint)["bytes_out"] += sent_bytes
+
+    def record_retry(self, endpoint):
+        with self.lock:
+            self.__endpoint(endpoint)["retries"] += 1
+
+    def record_bad_status_line(self, endpoint):
+        with self.lock:
+            self.__endpoint(endpoint)["bad_status_lines"] += 1
+
+    def snapshot(self):
+        snapshot = {}
+        with self.lock:
+            for endpoint, metrics in self.endpoints.items():
+                latencies = sorted(metrics["latencies"])
+                snapshot[endpoint] = {"count": metrics["count"], "bytes_out": metrics["bytes_out"], "retries": metrics["retries"],
+                        "bad_status_lines": metrics["bad_status_lines"], "errors": dict(metrics["errors"])}
+                for percentile in (50, 95, 99):
+                    if len(latencies) > 0:
+                        snapshot[endpoint]["p%d" % (percentile)] = latencies[min(len(latencies) - 1, int(math.ceil(percentile / 100.0 * len(latencies))) - 1)]
+                    else:
+                        snapshot[endpoint]["p%d" % (percentile)] = None
+        return snapshot
+
+
+def request_size(method, uri, body, headers):
+    """ Roughly how many bytes a request puts on the wire. """
+    return len(method) + len(uri) + sum([len(key) + len(value) + 4 for (key, value) in headers.items()]) + len(body or "")
+
+
+def error_name(exc_info):
+    """ How a failed call is counted in RequestMetrics: the HTTP status where there was one, otherwise the kind of failure. """
+    error = exc_info[1]
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, StatusNetError) and error.errcode > 0:
+        return str(error.errcode)
+    return "network"
+
+
+class ValidatorCache(object):
+    """ Remembers the ETag/Last-Modified validators one caller last saw for each URL, so its repeated fetches can be made conditional. A 304 only means "nothing new" to the caller that holds the page, so each keeps its own. """
+    def __init__(self, size=256):
+        self.size = size
+        self.validators = OrderedDict()
+        self.lock = threading.Lock()
+
+    def headers(self, url):
+        headers = {}
+        with self.lock:
+            etag, last_modified = self.validators.get(url, (None, None))
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def store(self, url, response):
+        etag = response.getheader("etag")
+        last_modified = response.getheader("last-modified")
+        with self.lock:
+            self.validators.pop(url, None)
+            if etag is None and last_modified is None:
+                return
+            self.validators[url] = (etag, last_modified)
+            while len(self.validators) > self.size:
+                self.validators.popitem(last=False)
+
+
+class NoticeCache(object):
+    """ Bounded LRU cache of notices by id. Notices are copied on the way in and out, nested user and retweeted_status dicts included, since callers decorate them with their own fields. """
+    def __init__(self, size=1000):
+        self.size = size
+        self.notices = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, id):
+        with self.lock:
+            notice = self.notices.pop(id, None)
+            if notice is None:
+                self.misses += 1
+                return None
+            self.notices[id] = notice  # re-insert to mark as most recently used
+            self.hits += 1
+            return json_copy(notice)
+
+    def store(self, notice):
+        with self.lock:
+            self.notices.pop(notice['id'], None)
+            self.notices[notice['id']] = json_copy(notice)
+            while len(self.notices) > self.size:
+                self.notices.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, id):
+        with self.lock:
+            self.notices.pop(id, None)
+
+
+class ProfileCache(object):
+    """ Bounded LRU cache of user or group profiles, by id and by lowercased name, with each entry expiring after ttl seconds. Profiles are copied on the way in and out, nested dicts such as a user's status included. """
+    def __init__(self, name_field, url_field, home=None, ttl=3600, size=2000):
+        self.name_field = name_field  # screen_name for users, nickname for groups
+        self.url_field = url_field  # where the profile's page is, which tells local profiles from remote ones
+        self.home = home  # the instance's host name, or None if every profile is local (as on Twitter)
+        self.ttl = ttl
+        self.size = size
+        self.profiles = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id=0, name=""):
+        if name != "":
+            key = ("name", name.lower())
+        else:
+            key = ("id", id)
+        with self.lock:
+            entry = self.profiles.pop(key, None)
+            if entry is None or time.time() - entry[0] >= self.ttl:
+                self.misses += 1
+                return None
+            self.profiles[key] = entry  # re-insert to mark as most recently used
+            self.hits += 1
+            return json_copy(entry[1])
+
+    def store(self, profile, by_name=False):  # by_name says the server resolved profile's name to it; otherwise only local profiles are found by name, since remote ones can share a local name
+        if not isinstance(profile, dict) or not "id" in profile:
+            return
+        keys = [("id", profile["id"])]
+        if self.name_field in profile and (by_name or self.is_local(profile)):
+            keys.append(("name", profile[self.name_field].lower()))
+        entry = (time.time(), json_copy(profile))
+        with self.lock:
+            for key in keys:
+                self.profiles.pop(key, None)
+                self.profiles[key] = entry
+            while len(self.profiles) > self.size:
+                self.profiles.popitem(last=False)
+
+    def is_local(self, profile):
+        if self.home is None:
+            return True
+        return urlparse.urlsplit(profile.get(self.url_field) or "").hostname == self.home
+
+
+class PreparedRequest(object):
+    """ A built and signed API request, ready for whichever transport sends it. """
+    def __init__(self, endpoint, method, uri, body, headers, validators=None, validator_key=None):
+        self.endpoint = endpoint
+        self.method = method
+        self.uri = uri
+        self.body = body
+        self.headers = headers
+        self.validators = validators  # the caller's ValidatorCache, and where in it this URL goes, for conditional GETs
+        self.validator_key = validator_key
+
+    def flight_key(self):  # requests with equal keys would get identical responses, so may share one
+        return (self.method, self.uri, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since"))
+
+
+class SingleFlight(object):
+    """ Coalesces concurrent identical requests: the first caller makes the call and later ones wait for its outcome. Counts the calls saved per endpoint. """
+    def __init__(self):
+        self.calls = {}  # key -> [Event, result, exc_info] for blocking callers
+        self.futures = {}  # key -> Future for AsyncStatusNet, whose single thread needs no locking
+        self.saved = {}
+        self.lock = threading.Lock()
+
+    def __count(self, endpoint):
+        with self.lock:
+            self.saved[endpoint] = self.saved.get(endpoint, 0) + 1
+
+    def do(self, key, endpoint, function):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = [threading.Event(), None, None]
+        if not leader:
+            self.__count(endpoint)
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2][0], call[2][1], call[2][2]
+            return call[1]
+
+        try:
+            call[1] = function()
+        except:
+            call[2] = sys.exc_info()
+        with self.lock:
+            del self.calls[key]
+        call[0].set()
+        if call[2] is not None:
+            raise call[2][0], call[2][1], call[2][2]
+        return call[1]
+
+    def join(self, key, endpoint, start):  # the Future-based twin of do()
+        future = self.futures.get(key)
+        if future is not None:
+            self.__count(endpoint)
+            return future
+        future = start()
+        if not future.done:
+            self.futures[key] = future
+            future.add_done_callback(lambda done: self.futures.pop(key, None))
+        return future
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.saved)
+
+
+class OAuthSigner(object):
+    """ Signs requests for one set of OAuth credentials, keeping a single oauthlib Client and a ready-keyed HMAC for the common plain GET. """
+    default_ports = {"http": 80, "https": 443}
+
+    def __init__(self, client_key, client_secret, resource_owner_key, resource_owner_secret):
+        self.client = oauth1.Client(client_key, client_secret=client_secret,
+                resource_owner_key=resource_owner_key, resource_owner_secret=resource_owner_secret)
+        self.client_key = oauth_escape(client_key)
+        self.resource_owner_key = oauth_escape(resource_owner_key)
+        self.hmac = hmac.new("%s&%s" % (oauth_escape(client_secret), oauth_escape(resource_owner_secret)), digestmod=hashlib.sha1)  # copied per request rather than re-keyed
+
+    def sign(self, uri, http_method="GET", body=None, headers=None):
+        if http_method == "GET" and body is None:
+            return self.sign_get(uri)
+        return self.client.sign(uri, http_method=http_method, body=body, headers=headers)
+
+    def sign_get(self, uri, nonce=None, timestamp=None):  # HMAC-SHA1 signing as in RFC 5849, done directly since a GET only has query parameters to cover
+        if nonce is None:
+            nonce = binascii.hexlify(os.urandom(16))
+        if timestamp is None:
+            timestamp = str(int(time.time()))
+        oauth_params = [("oauth_nonce", nonce), ("oauth_timestamp", timestamp), ("oauth_version", "1.0"),
+                ("oauth_signature_method", "HMAC-SHA1"), ("oauth_consumer_key", self.client_key), ("oauth_token", self.resource_owner_key)]
+
+        if isinstance(uri, unicode):  # parse_qsl would unquote a unicode query's UTF-8 escapes as Latin-1
+            scheme, netloc, path, query, fragment = urlparse.urlsplit(uri.encode("utf-8"))
+        else:
+            scheme, netloc, path, query, fragment = urlparse.urlsplit(uri)
+        scheme, netloc = scheme.lower(), netloc.lower()
+        if ":" in netloc and netloc.rsplit(":", 1)[1] == str(self.default_ports.get(scheme)):
+            netloc = netloc.rsplit(":", 1)[0]
+        params = sorted([(oauth_escape(key), oauth_escape(value)) for (key, value) in urlparse.parse_qsl(query, keep_blank_values=True)] + oauth_params)
+        base_string = "GET&%s&%s" % (oauth_escape("%s://%s%s" % (scheme, netloc, path or "/")), oauth_escape("&".join(["%s=%s" % (key, value) for (key, value) in params])))
+
+        signer = self.hmac.copy()
+        signer.update(base_string)
+        oauth_params.append(("oauth_signature", oauth_escape(base64.b64encode(signer.digest()))))
+        authorization = "OAuth %s" % (", ".join(['%s="%s"' % (key, value) for (key, value) in oauth_params]))
+        return uri, {"Authorization": authorization}, None
+
+
 class StatusNet(object):
-    def __init__(self, api_path, username="", password="", use_auth=True, auth_type="basic", oauth_token=None, oauth_token_secret=None, validate_ssl=True, save_oauth_credentials=None):
-        import base64
+    hydration_workers = 4  # matches the number of idle connections the pool keeps per host
+
+    def __init__(self, api_path, username="", password="", use_auth=True, auth_type="basic", oauth_token=None, oauth_token_secret=None, validate_ssl=True, save_oauth_credentials=None, notice_cache_size=1000, cache_dir=None, config_ttl=86400):
         self.api_path = api_path
         if self.api_path[-1] == "/":  # We don't want a surplus / when creating request URLs. Sure, most servers will handle it well, but why take the chance?
             self.api_path == self.api_path[:-1]
@@ -66,36 +898,71 @@ class StatusNet(object):
             self.is_twitter = True
         else:
             self.is_twitter = False
-        if validate_ssl:
-            self.opener = urllib2.build_opener()
-        else:
-            sh = urllib2.HTTPSHandler(context=ssl._create_unverified_context())
-            self.opener = urllib2.build_opener(sh)
+        self.pool = ConnectionPool(validate_ssl)
+        self.transfer_stats = TransferStats()
+        self.metrics = RequestMetrics()
+        self.notice_cache = NoticeCache(notice_cache_size)
+        home = None if self.is_twitter else urlparse.urlsplit(self.api_path).hostname
+        self.user_cache = ProfileCache("screen_name", "statusnet_profile_url", home)
+        self.group_cache = ProfileCache("nickname", "url", home)
+        self.slim_timelines = None  # whether the server honours trim_user; None until a poll has told us
+        self.current_user = None
+        self.retry_policy = RetryPolicy()
+        self.breakers = {}
+        self.breakers_lock = threading.Lock()
+        self.rate_limiter = RateLimiter()
+        self.single_flight = SingleFlight()
+        self.local = threading.local()
         self.use_auth = use_auth
         self.auth_type = auth_type
         self.oauth_token = oauth_token
         self.oauth_token_secret = oauth_token_secret
         self.save_oauth_credentials = save_oauth_credentials
+        self.oauth_signer = None
         self.auth_string = None
-        if not self.__checkconn():
-            raise Exception("Couldn't access %s, it may well be down." % (api_path))
+        self.cache_dir = cache_dir
+        self.config_ttl = config_ttl
+
+        bootstrap = [self.__checkconn]  # these run side by side, so startup costs one round-trip rather than three
         if self.use_auth:
             if auth_type == "basic":
                 self.auth_string = base64.encodestring('%s:%s' % (username, password))[:-1]
                 if self.is_twitter:
                     raise Exception("Twitter does not support basic auth; bailing out.")
-                if not self.account_verify_credentials():
-                    raise Exception("Invalid credentials")
             elif auth_type == "oauth":
                 if has_oauth:
+                    if (self.oauth_token is None) or (self.oauth_token_secret is None):  # authorising will prompt the user, so make sure the server is there first
+                        if not self.__checkconn():
+                            raise Exception("Couldn't access %s, it may well be down." % (api_path))
+                        bootstrap = []
                     self.oauth_initialize()
+                    self.oauth_signer = OAuthSigner("anonymous", "anonymous", self.oauth_token, self.oauth_token_secret)
                     if self.is_twitter:
                         self.api_path += "/1"
-                    if not self.account_verify_credentials():
-                        raise Exception("OAuth authentication failed")
                 else:
                     raise Exception("OAuth could not be initialised.")
-        self.server_config = self.statusnet_config()
+            bootstrap.append(self.account_verify_credentials)
+        self.server_config = self.__cachedconfig()
+        if self.server_config is None:
+            bootstrap.append(self.statusnet_config)
+
+        outcomes = self._runall(bootstrap)  # failures are looked at in the order the calls used to be made one by one
+        if self.__checkconn in bootstrap and not outcomes[0][0]:
+            raise Exception("Couldn't access %s, it may well be down." % (api_path))
+        if self.use_auth:
+            verified, exc_info = outcomes[bootstrap.index(self.account_verify_credentials)]
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if not verified:
+                if auth_type == "oauth":
+                    raise Exception("OAuth authentication failed")
+                raise Exception("Invalid credentials")
+        if self.server_config is None:
+            server_config, exc_info = outcomes[-1]
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            self.server_config = server_config
+            self.__storeconfig(self.server_config)
         try:
             self.length_limit = int(self.server_config["site"]["textlimit"]) # this will be 0 on unlimited instances
         except:
@@ -123,23 +990,28 @@ class StatusNet(object):
             if self.save_oauth_credentials is not None:
                 self.save_oauth_credentials(self.oauth_token, self.oauth_token_secret)
 
-    def __makerequest(self, resource_path, raw_params={}, force_get=False):
+    def __makerequest(self, resource_path, raw_params={}, force_get=False, conditional=False):  # conditional marks timeline calls, which are made conditional inside a conditional() block and then return an empty list on 304
+        return self._dispatch(self._preparerequest(resource_path, raw_params, force_get, conditional))
+
+    def _preparerequest(self, resource_path, raw_params={}, force_get=False, conditional=False):  # builds and signs a request without sending it, so every transport shares it
         params = urllib.urlencode(raw_params)
         
         if not resource_path in ["oauth/request_token", "oauth/access_token"]:
             resource_path = "%s.json" % (resource_path)
 
+        headers = {}
+        body = None
         if self.auth_type == "basic":
+            uri = "%s/%s" % (self.api_path, resource_path)
             if len(raw_params) > 0:
                 if force_get:
-                    request = urllib2.Request("%s/%s?%s" % (self.api_path, resource_path, params))
+                    uri = "%s?%s" % (uri, params)
                 else:
-                    request = urllib2.Request("%s/%s" % (self.api_path, resource_path), params)
-            else:
-                request = urllib2.Request("%s/%s" % (self.api_path, resource_path))
+                    body = params
+                    headers["Content-Type"] = "application/x-www-form-urlencoded"
 
             if self.auth_string is not None:
-                request.add_header("Authorization", "Basic %s" % (self.auth_string))
+                headers["Authorization"] = "Basic %s" % (self.auth_string)
 
         elif self.auth_type == "oauth":
             resource_url = "%s/%s" % (self.api_path, resource_path)
@@ -147,55 +1019,359 @@ class StatusNet(object):
             if len(raw_params) > 0 and force_get:
                 resource_url = "%s?%s" % (resource_url, params)
 
-            client = oauth1.Client("anonymous", client_secret="anonymous",
-                    resource_owner_key=self.oauth_token, resource_owner_secret=self.oauth_token_secret)
-
             if len(raw_params) > 0 and not force_get:
-                uri, headers, body = client.sign(resource_url, http_method="POST",
+                uri, headers, body = self.oauth_signer.sign(resource_url, http_method="POST",
                         headers={"Content-Type": "application/x-www-form-urlencoded"}, body=params)
-
-                request = urllib2.Request(uri, data=body, headers=headers)
             else:
-                uri, headers, body = client.sign(resource_url)
-                request = urllib2.Request(uri, headers=headers)
+                uri, headers, body = self.oauth_signer.sign(resource_url)
+
+        if body is None:
+            method = "GET"
+        else:
+            method = "POST"
+        headers["Accept-Encoding"] = "gzip, deflate"
+
+        validators = self.conditional_validators()
+        validator_key = None
+        if conditional and method == "GET" and validators is not None:
+            validator_key = "%s/%s?%s" % (self.api_path, resource_path, params)
+            headers.update(validators.headers(validator_key))
+        else:
+            validators = None
+
+        return PreparedRequest(endpoint_name(resource_path), method, uri, body, headers, validators, validator_key)
+
+    def _dispatch(self, request):  # sends a prepared request and blocks until it is done; AsyncStatusNet replaces this with one returning a Future
+        if request.method == "GET":  # identical GETs already in flight share one response, though each caller parses its own copy
+            response, content = self.single_flight.do(request.flight_key(), request.endpoint, lambda: self.__fetch(request))
+        else:
+            response, content = self.__fetch(request)
+        return self._finishrequest(request, response, content)
+
+    def __fetch(self, request):
+        in_background = self.in_background()
+        if request.endpoint != "account/rate_limit_status":
+            if in_background and self.rate_limiter.needs_refresh():
+                self.refresh_rate_limit()
+            self.rate_limiter.acquire(in_background)
+        started = time.time()
+        try:
+            response = self.__sendrequest(request.endpoint, request.method, request.uri, request.body, request.headers)
+            content = self.__readbody(request.endpoint, response)
+        except:
+            exc_info = sys.exc_info()
+            self.metrics.record(request.endpoint, time.time() - started, error_name(exc_info))
+            raise exc_info[0], exc_info[1], exc_info[2]
+        finally:
+            if request.endpoint != "account/rate_limit_status":
+                self.rate_limiter.release(in_background)
+        self.metrics.record(request.endpoint, time.time() - started, (response.status >= 400 or None) and str(response.status))
+        return response, content
+
+    def _streamrequest(self, request, store):  # sends request straight away, bypassing single_flight since a stream can't be shared, and returns an iterator over its notices
+        notices = self.__streamnotices(request, store)
+        next(notices)  # runs until the response headers are in, so errors are raised here rather than partway through the caller's loop
+        return notices
+
+    def __streamnotices(self, request, store):
+        in_background = self.in_background()
+        if in_background and self.rate_limiter.needs_refresh():
+            self.refresh_rate_limit()
+        self.rate_limiter.acquire(in_background)
+        started = time.time()
+        response = chunks = None
+        error = None
+        try:
+            try:
+                response = self.__sendrequest(request.endpoint, request.method, request.uri, request.body, request.headers)
+            finally:
+                self.rate_limiter.release(in_background)  # the request has been made, however slowly the caller reads
+            chunks = self.__iterbody(request.endpoint, response)
+            yield None
+            if request.validator_key is not None:
+                if response.status == 304:
+                    for chunk in chunks:  # there's no body, but this hands the connection back
+                        pass
+                    return
+                request.validators.store(request.validator_key, response)
+            try:
+                for notice in iter_json_array(chunks):
+                    yield store([notice])[0]
+            except (socket.error, httplib.HTTPException, ValueError), e:
+                raise StatusNetError(-1, "The response was cut off: %s" % (e))
+        except Exception:
+            error = error_name(sys.exc_info())
+            raise
+        finally:
+            if chunks is not None:
+                chunks.close()
+            if response is not None:
+                response.release()  # a caller that stopped early left the rest unread, so this closes the connection rather than reusing it
+            self.metrics.record(request.endpoint, time.time() - started, error)
+
+    def _finishrequest(self, request, response, content):
+        if request.validator_key is not None:
+            if response.status == 304:  # nothing has changed since the caller last fetched this, so skip parsing altogether
+                return []
+            request.validators.store(request.validator_key, response)
+
+        try:
+            return json.loads(content)
+        except ValueError:  # it wasn't JSON data, return it raw
+            return content
+
+    def _then(self, result, callback):  # applies post-processing to a request's result; AsyncStatusNet defers it until the result arrives
+        return callback(result)
+
+    def _resolved(self, value):  # wraps a value that needed no request, so it is returned the same way as one that did
+        return value
+
+    def _start(self, call):  # begins call() without waiting on it, for _finish to collect later; blocking calls get a thread each
+        in_background = self.in_background()
+
+        def run():
+            with self.background(in_background):  # keep the caller's priority on the new thread
+                return call()
+        return BackgroundCall(run)
+
+    def _finish(self, started):
+        return started.result()
+
+    def _runall(self, calls):  # makes each of calls concurrently, returning a (result, exc_info) pair for each in order, so the caller decides which failure counts
+        started = []
+        for call in calls:
+            try:
+                started.append((self._start(call), None))
+            except:
+                started.append((None, sys.exc_info()))
+        outcomes = []
+        for call, exc_info in started:
+            if exc_info is None:
+                try:
+                    outcomes.append((self._finish(call), None))
+                    continue
+                except:
+                    exc_info = sys.exc_info()
+            outcomes.append((None, exc_info))
+        return outcomes
+
+    def __sendrequest(self, endpoint, method, uri, body, headers):
+        host = urlparse.urlsplit(uri).netloc
+        breaker = self._breaker(host)
+        if breaker.retry_in() > 0:
+            raise CircuitOpenError(host, breaker.retry_in())
 
-        success = False
         response = None
         attempt_count = 0
-        while not success:
-            success = True  # succeed unless we hit BadStatusLine
-            if attempt_count >= 10:  # after 10 failed attempts
-                raise Exception("Could not successfully read any response. Please check that your connection is working.")
+        started = time.time()  # the budget covers time spent waiting on the server, not just backing off
+        while response is None:
+            error = None
+            retry_after = None
             try:
-                response = self.opener.open(request)
-            except urllib2.HTTPError, e:
-                raw_details = e.read()
-                try:
-                    err_details = json.loads(raw_details)['error']
-                except ValueError:  # not JSON, use raw
-                    err_details = raw_details
-                if (e.code % 400) < 100:  # only throw the error further up if it's not a server error
-                    raise StatusNetError(e.code, err_details)
-            except urllib2.URLError, e:
-                raise StatusNetError(-1, e.reason)
+                self.metrics.record_sent(endpoint, request_size(method, uri, body, headers))
+                response = self.pool.request(method, uri, body, headers)
+                self.rate_limiter.update_from_headers(response)
+                if response.status >= 400:
+                    errcode = response.status
+                    err_details = self._errordetails(self.__readbody(endpoint, response))
+                    retry_after = response.getheader("retry-after")
+                    response = None
+                    if errcode < 500:  # the server is fine, it just didn't like the request
+                        breaker.record_success()
+                        raise StatusNetError(errcode, err_details)
+                    error = StatusNetError(errcode, err_details)
+                    retryable = (method == "GET") or (errcode == 503)  # a 503 means a POST was never processed, other server errors might have been
             except httplib.BadStatusLine, e:
-                success = False
-            attempt_count += 1
+                self.metrics.record_bad_status_line(endpoint)
+                error = StatusNetError(-1, "Could not successfully read any response. Please check that your connection is working.")
+                retryable = (method == "GET")  # the request went out, so a POST may have been acted on already
+            except ssl.CertificateError, e:
+                raise StatusNetError(-1, e)
+            except socket.error, e:
+                error = StatusNetError(-1, e)
+                retryable = (method == "GET")
+
+            if error is not None:
+                breaker.record_failure()
+                attempt_count += 1
+                delay = self.retry_policy.delay(attempt_count, retry_after)
+                if (not retryable) or (attempt_count >= self.retry_policy.attempts) or (time.time() - started + delay > self.retry_policy.budget) or (breaker.retry_in() > 0):
+                    raise error
+                self.metrics.record_retry(endpoint)
+                time.sleep(delay)
+
+        breaker.record_success()
+        return response
+
+    def _errordetails(self, raw_details):
+        try:
+            return json.loads(raw_details)['error']
+        except (ValueError, KeyError, TypeError):  # not JSON, use raw
+            return raw_details
+
+    def _breaker(self, host):
+        with self.breakers_lock:
+            if not host in self.breakers:
+                self.breakers[host] = CircuitBreaker()
+            return self.breakers[host]
+
+    @contextlib.contextmanager
+    def background(self, enabled=True):  # not part of the API; requests made inside this block are background polls, which yield to interactive ones and are spaced out to fit the rate limit
+        previous = self.in_background()
+        self.local.background = enabled
+        try:
+            yield
+        finally:
+            self.local.background = previous
 
-        if response is None:
-            raise StatusNetError(-1, "Could not successfully read any response. Please check that your connection is working.")
+    def in_background(self):
+        return getattr(self.local, "background", False)
 
-        content = response.read()
+    @contextlib.contextmanager
+    def streaming(self, enabled=True):  # not part of the API; timeline calls made inside this block return an iterator yielding each notice as soon as it has been parsed, rather than a list once the whole page is in
+        previous = self.in_streaming()
+        self.local.streaming = enabled
+        try:
+            yield
+        finally:
+            self.local.streaming = previous
+
+    def in_streaming(self):
+        return getattr(self.local, "streaming", False)
 
+    @contextlib.contextmanager
+    def conditional(self, validators):  # not part of the API; timeline calls made inside this block send the validators in the ValidatorCache validators, and return an empty list if nothing has changed. Only pass one while already holding what those calls return, or None
+        previous = self.conditional_validators()
+        self.local.validators = validators
         try:
-            return json.loads(content)
-        except ValueError:  # it wasn't JSON data, return it raw
-            return content
+            yield
+        finally:
+            self.local.validators = previous
+
+    def conditional_validators(self):
+        return getattr(self.local, "validators", None)
+
+    def netstats(self):  # not part of the API; everything known about each endpoint's traffic, for tuning
+        stats = self.metrics.snapshot()
+        for endpoint, totals in self.transfer_stats.snapshot().items():
+            stats.setdefault(endpoint, {})["bytes_in"] = totals["compressed"]
+            stats[endpoint]["bytes_decoded"] = totals["decompressed"]
+        for endpoint, saved in self.single_flight.snapshot().items():
+            stats.setdefault(endpoint, {})["coalesced"] = saved
+        return stats
+
+    def circuit_retry_in(self):  # not part of the API; how long until requests to the API host are allowed again, 0 if they already are
+        return self._breaker(urlparse.urlsplit(self.api_path).netloc).retry_in()
+
+    def __cachenotices(self, notices):
+        return self._then(notices, self.__storenotices)
+
+    def __gettimeline(self, resource_path, params, since_id):  # polls ask for slim notices, since their authors are nearly always in user_cache already from the first, full, fetch
+        if self.in_streaming():  # streamed notices are handed over as they arrive, so there'd be no chance to rehydrate trimmed ones
+            return self._streamrequest(self._preparerequest(resource_path, params, force_get=True, conditional=True), self.__storenotices)
+        if since_id == 0 or self.slim_timelines is False:
+            return self.__cachenotices(self.__makerequest(resource_path, params, force_get=True, conditional=True))
+        refetch = lambda: self.__makerequest(resource_path, params, force_get=True)  # needs the whole page back, whatever the caller last saw
+        slim_params = dict(params, trim_user="true")
+        return self.__cachenotices(self._then(self.__makerequest(resource_path, slim_params, force_get=True, conditional=True), lambda notices: self.__rehydrate(notices, refetch)))
+
+    def __rehydrate(self, notices, refetch):  # puts full users back into trimmed notices, so callers can't tell the difference
+        if not isinstance(notices, list) or len(notices) == 0:
+            return notices
+        stubs = trimmed_users(notices)
+        if self.slim_timelines is None:
+            self.slim_timelines = len(stubs) > 0  # a server that ignored trim_user sent full users, so stop asking
+        missing = []
+        for stub in stubs:
+            user = self.user_cache.get(stub["id"])
+            if user is not None:
+                stub.update(user)
+            elif not stub["id"] in missing:
+                missing.append(stub["id"])
+        if len(missing) == 0:
+            return notices
+        if len(missing) > self.hydration_workers:  # more than one round of lookups costs more than the full page would have
+            return refetch()
+
+        def fill(pairs):
+            users = dict(pairs)
+            for stub in trimmed_users(notices):
+                if users.get(stub["id"]) is not None:
+                    stub.update(users[stub["id"]])
+            return [notice for notice in notices if len(trimmed_users([notice])) == 0]  # notices by authors who have since vanished can't be shown
+        return self._then(self.users_show_many(missing), fill)
+
+    def __storenotices(self, notices):
+        if isinstance(notices, list):
+            for notice in notices:
+                if isinstance(notice, dict) and "id" in notice:
+                    self.notice_cache.store(notice)
+                    self.user_cache.store(notice.get("user"))
+                    if "retweeted_status" in notice:
+                        self.notice_cache.store(notice["retweeted_status"])
+                        self.user_cache.store(notice["retweeted_status"].get("user"))
+        return notices
+
+    def __storeprofile(self, cache, profile, name):  # name is what the profile was asked for by, if anything
+        cache.store(profile, by_name=isinstance(profile, dict) and name != "" and profile.get(cache.name_field, "").lower() == name.lower())
+        return profile
+
+    def _storecurrentuser(self, user):  # remembers who we are authenticated as, so users_show() needn't ask again
+        self.current_user = user
+        self.user_cache.store(user, by_name=True)
+        return True
+
+    def __iterbody(self, endpoint, response, chunk_size=16384):
+        decoder = ContentDecoder(response.getheader("content-encoding"))
+        try:
+            while True:
+                chunk = response.read(chunk_size)
+                if chunk == "":
+                    break
+                data = decoder.decode(chunk)
+                if data != "":
+                    yield data
+            data = decoder.flush()
+            if data != "":
+                yield data
+        finally:
+            response.release()
+            self.transfer_stats.record(endpoint, decoder.compressed_bytes, decoder.decompressed_bytes)
+
+    def __readbody(self, endpoint, response):
+        return "".join(self.__iterbody(endpoint, response))
+
+    def __configcachefile(self):
+        return os.path.join(self.cache_dir, "server_config_%s.json" % (hashlib.sha1(self.api_path).hexdigest()[:16]))
+
+    def __cachedconfig(self):  # the server config saved by an earlier run, if it is still fresh
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.__configcachefile(), "r") as cache_file:
+                cached = json.load(cache_file)
+            if cached["api_path"] == self.api_path and 0 <= time.time() - cached["saved_at"] < self.config_ttl:
+                return cached["config"]
+        except (IOError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def __storeconfig(self, server_config):
+        if self.cache_dir is None or not isinstance(server_config, dict):
+            return
+        filename = self.__configcachefile()
+        try:
+            with open(filename + ".tmp", "w") as cache_file:
+                json.dump({"api_path": self.api_path, "saved_at": time.time(), "config": server_config}, cache_file)
+            os.rename(filename + ".tmp", filename)  # so a concurrent launch never reads half a file
+        except (IOError, OSError):  # caching is only an optimisation
+            pass
 
     def __checkconn(self):
         try:
-            self.opener.open(self.api_path+"/help/test.json")
-            return True
+            response = self.pool.request("GET", self.api_path+"/help/test.json")
+            response.read()
+            return response.status < 400
         except:
             return False
 
@@ -208,7 +1384,7 @@ class StatusNet(object):
 ######## Timeline resources ########
 
     def statuses_public_timeline(self):
-        return self.__makerequest("statuses/public_timeline")
+        return self.__cachenotices(self.__makerequest("statuses/public_timeline", conditional=True))
 
     def statuses_home_timeline(self, since_id=0, max_id=0, count=0, page=0):
         params = {}
@@ -220,7 +1396,7 @@ class StatusNet(object):
             params['count'] = count
         if not (page == 0):
             params['page'] = page
-        return self.__makerequest("statuses/home_timeline", params)
+        return self.__gettimeline("statuses/home_timeline", params, since_id)
 
     def statuses_friends_timeline(self, since_id=0, max_id=0, count=0, page=0, include_rts=False):
         params = {}
@@ -234,7 +1410,7 @@ class StatusNet(object):
             params['page'] = page
         if include_rts:
             params['include_rts'] = "true"
-        return self.__makerequest("statuses/friends_timeline", params)
+        return self.__gettimeline("statuses/friends_timeline", params, since_id)
 
     def statuses_mentions(self, since_id=0, max_id=0, count=0, page=0, include_rts=False):
         params = {}
@@ -248,7 +1424,7 @@ class StatusNet(object):
             params['page'] = page
         if include_rts:
             params['include_rts'] = "true"
-        return self.__makerequest("statuses/mentions", params)
+        return self.__gettimeline("statuses/mentions", params, since_id)
 
     def statuses_replies(self, since_id=0, max_id=0, count=0, page=0, include_rts=False):  # alias of mentions
         params = {}
@@ -262,7 +1438,7 @@ class StatusNet(object):
             params['page'] = page
         if include_rts:
             params['include_rts'] = "true"
-        return self.__makerequest("statuses/replies", params)
+        return self.__gettimeline("statuses/replies", params, since_id)
 
     def statuses_user_timeline(self, user_id=0, screen_name="", since_id=0, max_id=0, count=0, page=0, include_rts=False):
         params = {}
@@ -280,7 +1456,7 @@ class StatusNet(object):
             params['page'] = page
         if include_rts:
             params['include_rts'] = "true"
-        return self.__makerequest("statuses/user_timeline", params, force_get=True)
+        return self.__gettimeline("statuses/user_timeline", params, since_id)
 
 ### StatusNet does not implement this method yet
 #    def statuses_retweeted_by_me(self, since_id=0, max_id=0, count=0, page=0):
@@ -318,13 +1494,27 @@ class StatusNet(object):
             params['count'] = count
         if not (page == 0):
             params['page'] = page
-        return self.__makerequest("statuses/retweets_of_me", params)
+        return self.__gettimeline("statuses/retweets_of_me", params, since_id)
 
 
 ######## Status resources ########
     
-    def statuses_show(self, id):
-        return self.__makerequest("statuses/show/%s" % str(id))
+    def statuses_show(self, id, force_refresh=False):  # force_refresh is not part of the API; it skips the local notice cache
+        if not force_refresh:
+            notice = self.notice_cache.get(id)
+            if notice is not None:
+                return self._resolved(notice)
+        return self._then(self.__makerequest("statuses/show/%s" % str(id)), lambda notice: self.__storenotices([notice])[0])
+
+    def statuses_show_many(self, ids, known_ids=()):  # not part of the API; fetches several notices concurrently, returning (id, notice) pairs in order, with notice None if it has gone missing
+        ids = wanted_ids(ids, known_ids)
+        in_background = self.in_background()
+
+        def show(id):
+            with self.background(in_background):  # keep the caller's priority on the worker threads
+                return self.statuses_show(id)
+
+        return hydrated_pairs(ids, run_concurrently(show, [(id,) for id in ids], self.hydration_workers))
 
     def statuses_update(self, status, source="", in_reply_to_status_id=0, latitude=-200, longitude=-200, place_id="", display_coordinates=False, long_dent="split", dup_first_word=False):
         status = "".join([s.strip(" ") for s in status.split("\n")])  # rejoin split lines back to 1 line
@@ -345,28 +1535,33 @@ class StatusNet(object):
             if long_dent=="truncate":
                 params['status'] = status[:self.length_limit]
             elif long_dent=="split":
-                status_next = status[find_split_point(status, self.length_limit - 3):]
-                status = status.encode('utf-8')[:find_split_point(status, self.length_limit - 3)] + u"\u2026".encode('utf-8')
+                if isinstance(status, str):  # split on characters, not bytes
+                    status = status.decode('utf-8')
+                split_point = find_split_point(status, self.length_limit - 3)
+                status_next = status[split_point:]
+                status = status[:split_point] + u"\u2026"
                 if dup_first_word:
-                    status_next = status.split(" ")[0].encode('utf-8') + u"\u2026 ".encode('utf-8') + status_next
+                    status_next = status.split(" ")[0] + u"\u2026 " + status_next
                 else:
-                    status_next = u"\u2026 ".encode('utf-8') + status_next
-                params['status'] = status
-                dents = [self.__makerequest("statuses/update", params)] # post the first piece as normal
-                if in_reply_to_status_id == 0:
-                    in_reply_to_status_id = dents[-1]["id"]  # if this is not a reply, string everything onto the first dent
-                next_dent = self.statuses_update(status_next, source=source, in_reply_to_status_id=in_reply_to_status_id, latitude=latitude, longitude=longitude, place_id=place_id, display_coordinates=display_coordinates, long_dent=long_dent) # then hand the rest off for potential further splitting
-                if isinstance(next_dent, list):
-                    for dent in next_dent:
-                        dents.append(dent)
-                else:
-                    dents.append(next_dent)
+                    status_next = u"\u2026 " + status_next
+                params['status'] = status.encode('utf-8')
+
+                def post_rest(first_dent):
+                    reply_to = in_reply_to_status_id
+                    if reply_to == 0:
+                        reply_to = first_dent["id"]  # if this is not a reply, string everything onto the first dent
+                    rest = self.statuses_update(status_next, source=source, in_reply_to_status_id=reply_to, latitude=latitude, longitude=longitude, place_id=place_id, display_coordinates=display_coordinates, long_dent=long_dent) # then hand the rest off for potential further splitting
+                    return self._then(rest, lambda next_dents: [first_dent] + (next_dents if isinstance(next_dents, list) else [next_dents]))
+                return self._then(self.__makerequest("statuses/update", params), post_rest) # post the first piece as normal, returning every piece in order
             else:
                 raise Exception("Maximum status length exceeded by %d characters." % (len(status) - self.length_limit))
-        return self.__makerequest("statuses/update", params)  
+        if isinstance(params['status'], unicode):  # as the later pieces of a split notice are
+            params['status'] = params['status'].encode('utf-8')
+        return self.__makerequest("statuses/update", params)
 
     def statuses_destroy(self, id):
         params = {'id':id}
+        self.notice_cache.discard(id)
         return self.__makerequest("statuses/destroy", params)
 
     def statuses_retweet(self, id, source=""):
@@ -386,7 +1581,7 @@ class StatusNet(object):
             params['screen_name'] = screen_name
         if not (cursor == 0):
             params['cursor'] = cursor
-        return self.__makerequest("statuses/friends", params)
+        return self.__makerequest("statuses/friends", params, force_get=True)
 
     def statuses_followers(self, user_id=0, screen_name="", cursor=0):
         params = {}
@@ -396,15 +1591,64 @@ class StatusNet(object):
             params['screen_name'] = screen_name
         if not (cursor == 0):
             params['cursor'] = cursor
-        return self.__makerequest("statuses/followers", params)
-
-    def users_show(self, user_id=0, screen_name=""):
+        return self.__makerequest("statuses/followers", params, force_get=True)
+
+    def iter_friends(self, user_id=0, screen_name="", prefetch=True):  # not part of the API; yields every profile from statuses/friends, following next_cursor page by page
+        return self.__iterpages(lambda cursor: self.statuses_friends(user_id, screen_name, cursor), "users", prefetch)
+
+    def iter_followers(self, user_id=0, screen_name="", prefetch=True):  # not part of the API; as iter_friends, for statuses/followers
+        return self.__iterpages(lambda cursor: self.statuses_followers(user_id, screen_name, cursor), "users", prefetch)
+
+    def __iterpages(self, fetch, key, prefetch):  # only the page being yielded and the one being prefetched are held at once
+        page = self._finish(self._start(lambda: fetch(-1)))  # a cursor of -1 asks for the first page in cursored form
+        while True:
+            if isinstance(page, dict):
+                items = page.get(key, [])
+                next_cursor = int(page.get("next_cursor", 0))
+            else:  # the server doesn't do cursors, so this list is everything
+                items = page
+                next_cursor = 0
+            upcoming = None
+            if next_cursor != 0 and prefetch:
+                upcoming = self._start(lambda cursor=next_cursor: fetch(cursor))
+            for item in items:
+                if key == "users":
+                    self.user_cache.store(item)
+                yield item
+            if next_cursor == 0:
+                return
+            if upcoming is None:
+                upcoming = self._start(lambda cursor=next_cursor: fetch(cursor))
+            page = self._finish(upcoming)
+
+    def users_show(self, user_id=0, screen_name="", force_refresh=False):  # force_refresh is not part of the API; it skips the local profile cache
         params = {}
         if not (user_id == 0):
             params['user_id'] = user_id
         if not (screen_name == ""):
             params['screen_name'] = screen_name
-        return self.__makerequest("users/show", params, True)
+        if not force_refresh:
+            if len(params) == 0:
+                user = self.current_user and dict(self.current_user)
+            else:
+                user = self.user_cache.get(user_id, screen_name)
+            if user is not None:
+                return self._resolved(user)
+        return self._then(self.__makerequest("users/show", params, True), lambda user: self.__storeprofile(self.user_cache, user, screen_name))
+
+    def users_show_many(self, user_ids):  # not part of the API; fetches several profiles concurrently, returning (id, profile) pairs in order, with profile None if there is no such user
+        in_background = self.in_background()
+
+        def show(user_id):
+            with self.background(in_background):
+                return self.users_show(user_id=user_id)
+
+        return hydrated_pairs(user_ids, run_concurrently(show, [(user_id,) for user_id in user_ids], self.hydration_workers))
+
+    def lookup_ids(self, screen_names=(), nicknames=()):  # not part of the API; returns (user ids, group ids) for the given names, asking the server only about those not cached, and all at once. A screen_name of "" means the authenticated user
+        lookups = [(self.users_show, {'screen_name': name}) for name in screen_names] + [(self.statusnet_groups_show, {'nickname': name}) for name in nicknames]
+        ids = outcome_results(run_concurrently(lambda show, kwargs: show(**kwargs)['id'], lookups, self.hydration_workers))
+        return ids[:len(screen_names)], ids[len(screen_names):]
 
 
 ######## Direct message resources ########
@@ -419,7 +1663,7 @@ class StatusNet(object):
             params['count'] = count
         if not (page == 0):
             params['page'] = page
-        return self.__makerequest("direct_messages", params)
+        return self.__makerequest("direct_messages", params, force_get=True, conditional=True)
 
     def direct_messages_sent(self, since_id=0, max_id=0, count=0, page=0):
         params = {}
@@ -431,7 +1675,7 @@ class StatusNet(object):
             params['count'] = count
         if not (page == 0):
             params['page'] = page
-        return self.__makerequest("direct_messages/sent", params)
+        return self.__makerequest("direct_messages/sent", params, force_get=True, conditional=True)
 
     def direct_messages_new(self, screen_name, user_id, text, source=""):
         params = {'screen_name':screen_name, 'user_id':user_id, 'text':text}
@@ -483,21 +1727,26 @@ class StatusNet(object):
         params = {'user_id':user_id, 'screen_name':screen_name}
         if not (cursor == 0):
             params['cursor'] = cursor
-        return self.__makerequest("friends/ids", params)
+        return self.__makerequest("friends/ids", params, force_get=True)
 
     def followers_ids(self, user_id, screen_name, cursor=0):
         params = {'user_id':user_id, 'screen_name':screen_name}
         if not (cursor == 0):
             params['cursor'] = cursor
-        return self.__makerequest("followers/ids", params)
+        return self.__makerequest("followers/ids", params, force_get=True)
+
+    def iter_friends_ids(self, user_id=0, screen_name="", prefetch=True):  # not part of the API; yields every id from friends/ids, following next_cursor page by page
+        return self.__iterpages(lambda cursor: self.friends_ids(user_id, screen_name, cursor), "ids", prefetch)
+
+    def iter_followers_ids(self, user_id=0, screen_name="", prefetch=True):  # not part of the API; as iter_friends_ids, for followers/ids
+        return self.__iterpages(lambda cursor: self.followers_ids(user_id, screen_name, cursor), "ids", prefetch)
 
 
 ######## Account resources ########
 
     def account_verify_credentials(self):
         try:
-            result = self.__makerequest("account/verify_credentials")
-            return True
+            return self._storecurrentuser(self.__makerequest("account/verify_credentials"))
         except:
             return False
 
@@ -510,6 +1759,17 @@ class StatusNet(object):
     def account_rate_limit_status(self):
         return self.__makerequest("account/rate_limit_status")
 
+    def cycle_delay(self, hits):  # not part of the API; 0 once a polling cycle of about hits background calls may go ahead, otherwise how long to hold it back for the quota to last until it resets
+        if self.rate_limiter.needs_refresh():
+            self.refresh_rate_limit()
+        return self.rate_limiter.try_cycle(hits)
+
+    def refresh_rate_limit(self):  # not part of the API; feeds account/rate_limit_status into the request scheduler
+        try:
+            self.rate_limiter.update_from_status(self.account_rate_limit_status())
+        except StatusNetError:  # not supported here, so rely on response headers alone
+            self.rate_limiter.update(None, None, None)
+
     # account/update_profile_background_image - to be implemented if/when we have a helper function for multipart/form-data encoding
 
     # account/update_profile_imagee - to be implemented if/when we have a helper function for multipart/form-data encoding
@@ -525,7 +1785,7 @@ class StatusNet(object):
             params['page'] = page
         if not (since_id == 0):
             params['since_id'] = since_id
-        return self.__makerequest("favorites", params)
+        return self.__gettimeline("favorites", params, since_id)
 
     def favorites_create(self, id):
         params = {'id':id}
@@ -584,9 +1844,7 @@ class StatusNet(object):
         client = oauth1.Client("anonymous", client_secret="anonymous", callback_uri="oob")
         uri, headers, body = client.sign(endpoint)
 
-        request = urllib2.Request(endpoint, data=body, headers=headers)
-
-        return self.opener.open(request).read()
+        return self.__tokenrequest(uri, headers, body)
     
     def oauth_authorize(self, request_token):
         return raw_input("To authorize IdentiCurse to access your account, you must go to %s/oauth/authorize?oauth_token=%s in your web browser.\nPlease enter the verification code you receive there: " % (self.api_path, request_token))
@@ -600,12 +1858,21 @@ class StatusNet(object):
 
         uri, headers, body = client.sign(endpoint)
 
-        request = urllib2.Request(endpoint, data=body, headers=headers)
-        return self.opener.open(request).read()
+        return self.__tokenrequest(uri, headers, body)
+
+    def __tokenrequest(self, uri, headers, body):
+        if body is None:
+            response = self.pool.request("GET", uri, None, headers)
+        else:
+            response = self.pool.request("POST", uri, body, headers)
+        content = response.read()
+        if response.status >= 400:
+            raise StatusNetError(response.status, content)
+        return content
 
 ######## Search ########
 
-    def search(self, query, since_id=0, max_id=0, count=0, page=0, standardise=False):
+    def search(self, query, since_id=0, max_id=0, count=0, page=0, standardise=False, known_ids=(), missing=None):
         params = {'q':query}
         if not (since_id == 0):
             params['since_id'] = since_id
@@ -616,10 +1883,18 @@ class StatusNet(object):
         if not (page == 0):
             params['page'] = page
         if standardise:   # standardise is not part of the API, it is intended to make search results able to be handled as a standard timeline by replacing results with the actual notices as returned by statuses/show
-            results = [self.statuses_show(result['id']) for result in self.__makerequest("search", params)['results']]
-            return results
+            def hydrate(results):
+                if results == []:  # a 304 from a conditional search, so there's nothing new to fetch
+                    return results
+                hydrated = self.statuses_show_many([result['id'] for result in results['results']], known_ids)
+                def found(pairs):  # ids in known_ids are left out, since the caller already has them
+                    if missing is not None:  # not part of the API either; hits that have gone missing are reported here, since they can't go in a standard timeline
+                        missing.extend([id for (id, notice) in pairs if notice is None])
+                    return [notice for (id, notice) in pairs if notice is not None]
+                return self._then(hydrated, found)
+            return self._then(self.__makerequest("search", params, force_get=True, conditional=True), hydrate)
         else:
-            return self.__makerequest("search", params)
+            return self.__makerequest("search", params, force_get=True, conditional=True)
 
 
 ##########################
@@ -644,24 +1919,29 @@ class StatusNet(object):
         if not (page == 0):
             params['page'] = page
         if 'id' in params:
-            return self.__makerequest("statusnet/groups/timeline/%d" % (group_id), params)
+            return self.__gettimeline("statusnet/groups/timeline/%d" % (group_id), params, since_id)
         elif 'nickname' in params:
-            return self.__makerequest("statusnet/groups/timeline/%s" % (nickname), params)
+            return self.__gettimeline("statusnet/groups/timeline/%s" % (nickname), params, since_id)
         else:
             raise Exception("At least one of group_id or nickname must be supplied")
 
-    def statusnet_groups_show(self, group_id=0, nickname=""):
+    def statusnet_groups_show(self, group_id=0, nickname="", force_refresh=False):  # force_refresh is not part of the API; it skips the local profile cache
         params = {}
         if not (group_id == 0):
             params['id'] = group_id
         if not (nickname == ""):
             params['nickname'] = nickname
+        if len(params) > 0 and not force_refresh:
+            group = self.group_cache.get(group_id, nickname)
+            if group is not None:
+                return self._resolved(group)
         if 'id' in params:
-            return self.__makerequest("statusnet/groups/show/%d" % (group_id), params)
+            group = self.__makerequest("statusnet/groups/show/%d" % (group_id), params)
         elif 'nickname' in params:
-            return self.__makerequest("statusnet/groups/show/%s" % (nickname), params)
+            group = self.__makerequest("statusnet/groups/show/%s" % (nickname), params)
         else:
             raise Exception("At least one of group_id or nickname must be supplied")
+        return self._then(group, lambda group: self.__storeprofile(self.group_cache, group, nickname))
 
     # statusnet/groups/create -- does not seem to match the proposed API, will leave unimplemented for now
 
@@ -720,7 +2000,7 @@ class StatusNet(object):
 
     def statusnet_groups_is_member(self, user_id, group_id):
         params = {'user_id':user_id, 'group_id':group_id}
-        return self.__makerequest("statusnet/groups/is_member", params)['is_member']
+        return self._then(self.__makerequest("statusnet/groups/is_member", params), lambda result: result['is_member'])
 
 ######## Tag resources ########
 
@@ -734,7 +2014,7 @@ class StatusNet(object):
             params['count'] = count
         if not (page == 0):
             params['page'] = page
-        return self.__makerequest("statusnet/tags/timeline/%s" % (tag), params)
+        return self.__gettimeline("statusnet/tags/timeline/%s" % (tag), params, since_id)
 
 
 ######## Media resources ########
@@ -753,7 +2033,7 @@ class StatusNet(object):
             params['count'] = count
         if not (page == 0):
             params['page'] = page
-        return self.__makerequest("statusnet/conversation/%s" % str(id), params, force_get=True)
+        return self.__gettimeline("statusnet/conversation/%s" % str(id), params, since_id)
 
 
 ######## Miscellanea ########
@@ -763,3 +2043,587 @@ class StatusNet(object):
 
     def statusnet_version(self):
         return self.__makerequest("statusnet/version")
+
+
+#######################
+# ASYNCHRONOUS CLIENT #
+#######################
+
+
+class Future(object):
+    """ The eventual result of an asynchronous call, completed by the EventLoop that runs it. """
+    def __init__(self):
+        self.done = False
+        self.value = None
+        self.exc_info = None
+        self.callbacks = []
+
+    def set_result(self, value):
+        self.value = value
+        self.__complete()
+
+    def set_exception(self, exc_info):
+        self.exc_info = exc_info
+        self.__complete()
+
+    def follow(self, other):  # complete this future the same way other completed
+        if other.exc_info is not None:
+            self.set_exception(other.exc_info)
+        else:
+            self.set_result(other.value)
+
+    def __complete(self):
+        self.done = True
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        if self.done:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def result(self):
+        if not self.done:
+            raise Exception("This call hasn't finished yet, run its EventLoop until it has.")
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+    def then(self, callback, errback=None):
+        """ A new Future for callback(result), or errback(exc_info) on failure. Either may return another Future, which is waited on in turn. """
+        chained = Future()
+
+        def complete(future):
+            try:
+                if future.exc_info is None:
+                    value = callback(future.value)
+                elif errback is not None:
+                    value = errback(future.exc_info)
+                else:
+                    chained.set_exception(future.exc_info)
+                    return
+            except:
+                chained.set_exception(sys.exc_info())
+                return
+            if isinstance(value, Future):
+                value.add_done_callback(chained.follow)
+            else:
+                chained.set_result(value)
+        self.add_done_callback(complete)
+        return chained
+
+
+def resolved_future(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def failed_future(error):
+    future = Future()
+    future.set_exception((error.__class__, error, None))
+    return future
+
+
+def gather(futures):
+    """ A Future for the (result, exc_info) pairs of all of futures, in order, like run_concurrently returns. """
+    gathered = Future()
+    results = [None] * len(futures)
+    remaining = [len(futures)]
+
+    def collect(index, future):
+        results[index] = (future.value, future.exc_info)
+        remaining[0] -= 1
+        if remaining[0] == 0:
+            gathered.set_result(results)
+    for index, future in enumerate(futures):
+        future.add_done_callback(lambda future, index=index: collect(index, future))
+    if len(futures) == 0:
+        gathered.set_result(results)
+    return gathered
+
+
+class AsyncResponse(object):
+    """ A fully received HTTP response, with the same status/getheader surface as PooledResponse. """
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+
+class AsyncExchange(object):
+    """ Drives a single request over a non-blocking socket, from connecting through to a parsed response. """
+    def __init__(self, loop, method, url, body, headers, future):
+        self.loop = loop
+        self.method = method
+        self.future = future
+        split = urlparse.urlsplit(str(url))
+        self.key = (split.scheme, split.netloc)
+        self.host = split.hostname
+        self.port = split.port or (443 if split.scheme == "https" else 80)
+        path = split.path or "/"
+        if split.query != "":
+            path = "%s?%s" % (path, split.query)
+        lines = ["%s %s HTTP/1.1" % (method, path), "Host: %s" % (split.netloc)]
+        for key, value in headers.items():
+            lines.append("%s: %s" % (key, value))
+        if body is not None:
+            body = str(body)
+            lines.append("Content-Length: %d" % (len(body)))
+        self.request_data = "\r\n".join(lines) + "\r\n\r\n" + (body or "")
+        self.sock = None
+        self.reused = False
+        self.timer = None
+
+    def start(self):
+        self.timer = self.loop.call_later(self.loop.timeout, self.__timedout)
+        self.sock = self.loop.checkout(self.key)
+        if self.sock is not None and socket_dropped(self.sock):  # caught before anything is written, so even a POST can go on a fresh one
+            self.sock.close()
+            self.sock = None
+        if self.sock is None:
+            self.__connect()
+        else:
+            self.reused = True
+            self.__begin()
+
+    def __connect(self):
+        self.reused = False
+        try:
+            family, socktype, proto, canonname, address = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0]  # name lookups still block, but are cached by the resolver after the first
+            self.sock = socket.socket(family, socktype, proto)
+            self.sock.setblocking(0)
+            error = self.sock.connect_ex(address)
+        except socket.error:
+            return self.__fail(sys.exc_info())
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            return self.__fail((socket.error, socket.error(error, os.strerror(error)), None))
+        self.loop.watch(self.sock, False, self.__connected)
+
+    def __connected(self):
+        error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error != 0:
+            return self.__fail((socket.error, socket.error(error, os.strerror(error)), None))
+        if self.key[0] == "https":
+            self.sock = self.loop.ssl_context.wrap_socket(self.sock, server_hostname=self.host, do_handshake_on_connect=False)
+            self.__handshake()
+        else:
+            self.__begin()
+
+    def __handshake(self):
+        try:
+            self.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            return self.loop.watch(self.sock, True, self.__handshake)
+        except ssl.SSLWantWriteError:
+            return self.loop.watch(self.sock, False, self.__handshake)
+        except (ssl.CertificateError, socket.error):
+            return self.__fail(sys.exc_info())
+        self.__begin()
+
+    def __begin(self):
+        self.outgoing = self.request_data
+        self.incoming = ""
+        self.received_any = False
+        self.status = None
+        self.__send()
+
+    def __send(self):
+        try:
+            sent = self.sock.send(self.outgoing)
+        except ssl.SSLWantReadError:
+            return self.loop.watch(self.sock, True, self.__send)
+        except ssl.SSLWantWriteError:
+            return self.loop.watch(self.sock, False, self.__send)
+        except socket.error, e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return self.loop.watch(self.sock, False, self.__send)
+            return self.__stale(sys.exc_info())
+        self.outgoing = self.outgoing[sent:]
+        if self.outgoing != "":
+            self.loop.watch(self.sock, False, self.__send)
+        else:
+            self.loop.watch(self.sock, True, self.__receive)
+
+    def __receive(self):
+        while True:  # drain the socket, including anything the TLS layer has already buffered
+            try:
+                data = self.sock.recv(65536)
+            except ssl.SSLWantReadError:
+                return self.loop.watch(self.sock, True, self.__receive)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return self.loop.watch(self.sock, True, self.__receive)
+                return self.__stale(sys.exc_info())
+            if data == "":
+                return self.__closed()
+            self.received_any = True
+            self.incoming += data
+            try:
+                if self.__parse():
+                    return
+            except (httplib.HTTPException, ValueError):
+                return self.__fail(sys.exc_info())
+
+    def __parse(self):  # returns True once the whole response is in
+        if self.status is None:
+            head_end = self.incoming.find("\r\n\r\n")
+            if head_end < 0:
+                return False
+            head, self.incoming = self.incoming[:head_end].split("\r\n"), self.incoming[head_end+4:]
+            status_line = head[0].split(" ", 2)
+            if len(status_line) < 2 or not status_line[0].startswith("HTTP/"):
+                raise httplib.BadStatusLine(head[0])
+            self.version = status_line[0]
+            self.status = int(status_line[1])
+            self.reason = (status_line[2:] or [""])[0]
+            self.headers = {}
+            for line in head[1:]:
+                name, sep, value = line.partition(":")
+                name = name.strip().lower()
+                if name in self.headers:
+                    self.headers[name] = "%s, %s" % (self.headers[name], value.strip())
+                else:
+                    self.headers[name] = value.strip()
+            self.body = []
+            self.chunk_left = None
+            if self.method == "HEAD" or self.status in (204, 304) or 100 <= self.status < 200:
+                self.length = 0
+            elif "chunked" in self.headers.get("transfer-encoding", "").lower():
+                self.length = "chunked"
+            elif "content-length" in self.headers:
+                self.length = int(self.headers["content-length"])
+            else:
+                self.length = None  # read until the server closes the connection
+
+        if self.length == "chunked":
+            while True:
+                if self.chunk_left is None:
+                    line_end = self.incoming.find("\r\n")
+                    if line_end < 0:
+                        return False
+                    self.chunk_left = int(self.incoming[:line_end].split(";")[0], 16)
+                    self.incoming = self.incoming[line_end+2:]
+                if self.chunk_left == 0:
+                    if self.incoming.startswith("\r\n"):
+                        self.incoming = self.incoming[2:]
+                    elif self.incoming.find("\r\n\r\n") >= 0:  # skip any trailers
+                        self.incoming = self.incoming[self.incoming.find("\r\n\r\n")+4:]
+                    else:
+                        return False
+                    break
+                if len(self.incoming) < self.chunk_left + 2:
+                    return False
+                self.body.append(self.incoming[:self.chunk_left])
+                self.incoming = self.incoming[self.chunk_left+2:]
+                self.chunk_left = None
+        elif self.length is not None:
+            if len(self.incoming) < self.length:
+                return False
+            self.body.append(self.incoming[:self.length])
+            self.incoming = self.incoming[self.length:]
+        else:
+            return False
+
+        keep_alive = self.version == "HTTP/1.1" and self.headers.get("connection", "").lower() != "close"
+        self.__finish(keep_alive)
+        return True
+
+    def __closed(self):
+        if self.status is not None and self.length is None:
+            self.body.append(self.incoming)
+            return self.__finish(False)
+        if not self.received_any:
+            return self.__stale((httplib.BadStatusLine, httplib.BadStatusLine(""), None))
+        self.__fail((httplib.IncompleteRead, httplib.IncompleteRead(self.incoming), None))
+
+    def __stale(self, exc_info):
+        if self.reused and not self.received_any and (self.method == "GET" or self.outgoing == self.request_data):  # the server dropped this idle connection, so retry on a fresh one, unless a POST may have got through
+            self.loop.unwatch(self.sock)
+            self.sock.close()
+            return self.__connect()
+        self.__fail(exc_info)
+
+    def __timedout(self):
+        self.timer = None
+        self.__fail((socket.timeout, socket.timeout("timed out"), None))
+
+    def __finish(self, keep_alive):
+        self.loop.unwatch(self.sock)
+        self.loop.cancel(self.timer)
+        if keep_alive:
+            self.loop.checkin(self.key, self.sock)
+        else:
+            self.sock.close()
+            self.loop.checkin(self.key, None)
+        self.future.set_result(AsyncResponse(self.status, self.reason, self.headers, "".join(self.body)))
+
+    def __fail(self, exc_info):
+        if self.timer is not None:
+            self.loop.cancel(self.timer)
+        if self.sock is not None:
+            self.loop.unwatch(self.sock)
+            self.sock.close()
+        self.loop.checkin(self.key, None)
+        self.future.set_exception(exc_info)
+
+
+class EventLoop(object):
+    """ A minimal select()-based loop running any number of non-blocking HTTP requests from a single thread. """
+    redirect_codes = ConnectionPool.redirect_codes
+
+    def __init__(self, validate_ssl=True, max_connections_per_host=8, max_idle_per_host=4, timeout=60):
+        self.max_connections_per_host = max_connections_per_host
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        if validate_ssl:
+            self.ssl_context = ssl.create_default_context()
+        else:
+            self.ssl_context = ssl._create_unverified_context()
+        self.watched = {}  # fd -> (socket, readable, callback)
+        self.timers = []
+        self.timer_ids = itertools.count()
+        self.idle = {}
+        self.active = {}
+        self.waiting = {}
+
+    def watch(self, sock, readable, callback):  # call callback once sock is readable (or writable, if readable is False)
+        self.watched[sock.fileno()] = (sock, readable, callback)
+
+    def unwatch(self, sock):
+        for fd, (watched_sock, readable, callback) in self.watched.items():
+            if watched_sock is sock:
+                del self.watched[fd]
+
+    def call_later(self, delay, callback):
+        timer = [time.time() + delay, next(self.timer_ids), callback]
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        timer[2] = None
+
+    def sleep(self, delay):
+        future = Future()
+        self.call_later(delay, lambda: future.set_result(None))
+        return future
+
+    def checkout(self, key):  # an idle socket for key, or None if a new connection should be made
+        self.active[key] = self.active.get(key, 0) + 1
+        idle = self.idle.get(key, [])
+        if len(idle) > 0:
+            return idle.pop()
+        return None
+
+    def checkin(self, key, sock):  # sock is None if the connection was closed
+        self.active[key] -= 1
+        if sock is not None:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(sock)
+            else:
+                sock.close()
+        waiting = self.waiting.get(key, [])
+        if len(waiting) > 0:
+            waiting.pop(0).start()
+
+    def fetch(self, method, url, body=None, headers={}, redirects=5):
+        """ A Future for the AsyncResponse to a request, following redirects the same way ConnectionPool.request does. """
+        future = Future()
+        exchange = AsyncExchange(self, method, url, body, headers, future)
+        if self.active.get(exchange.key, 0) >= self.max_connections_per_host:
+            self.waiting.setdefault(exchange.key, []).append(exchange)
+        else:
+            exchange.start()
+
+        def follow(response):
+            location = response.getheader("location")
+            if response.status in self.redirect_codes and location is not None and redirects > 0 and not (method == "POST" and response.status == 307):
+                if method == "POST":
+                    return self.fetch("GET", urlparse.urljoin(url, location), None, dict((key, value) for (key, value) in headers.items() if not key.lower().startswith("content-")), redirects - 1)
+                return self.fetch(method, urlparse.urljoin(url, location), body, headers, redirects - 1)
+            return response
+        return future.then(follow)
+
+    def run_once(self, timeout=None):  # waits for socket activity or the next timer, whichever comes first, then runs whatever is due
+        while len(self.timers) > 0 and self.timers[0][2] is None:  # drop cancelled timers, so they can't hold the wait open
+            heapq.heappop(self.timers)
+        wait = timeout
+        if len(self.timers) > 0:
+            wait = max(0, self.timers[0][0] - time.time())
+            if timeout is not None:
+                wait = min(wait, timeout)
+
+        if len(self.watched) == 0:
+            if wait is not None:
+                time.sleep(wait)
+        else:
+            readers = [fd for (fd, (sock, readable, callback)) in self.watched.items() if readable]
+            writers = [fd for (fd, (sock, readable, callback)) in self.watched.items() if not readable]
+            try:
+                readable, writable, errored = select.select(readers, writers, [], wait)
+            except select.error, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                readable, writable = [], []
+            for fd in readable + writable:
+                watched = self.watched.pop(fd, None)
+                if watched is not None:
+                    watched[2]()
+
+        now = time.time()
+        while len(self.timers) > 0 and self.timers[0][0] <= now:
+            callback = heapq.heappop(self.timers)[2]
+            if callback is not None:
+                callback()
+
+    def run_until_complete(self, future):
+        """ Run the loop until future is done, then return its result (or raise its exception). """
+        while not future.done:
+            if len(self.watched) == 0 and not any(timer[2] is not None for timer in self.timers):
+                raise Exception("Nothing left to run, but the call still hasn't finished.")
+            self.run_once()
+        return future.result()
+
+    def close(self):
+        for idle in self.idle.values():
+            for sock in idle:
+                sock.close()
+        self.idle = {}
+
+
+class AsyncStatusNet(StatusNet):
+    """ The same methods as StatusNet, but each returns a Future straight away, so many calls can be in flight at once on one thread. Run them with loop.run_until_complete(). """
+    def __init__(self, api_path, username="", password="", use_auth=True, auth_type="basic", oauth_token=None, oauth_token_secret=None, validate_ssl=True, save_oauth_credentials=None, notice_cache_size=1000, cache_dir=None, config_ttl=86400, loop=None):
+        if loop is None:
+            loop = EventLoop(validate_ssl)
+        self.loop = loop
+        StatusNet.__init__(self, api_path, username, password, use_auth, auth_type, oauth_token, oauth_token_secret, validate_ssl, save_oauth_credentials, notice_cache_size, cache_dir, config_ttl)
+
+    def _dispatch(self, request):
+        if request.method == "GET":
+            fetched = self.single_flight.join(request.flight_key(), request.endpoint, lambda: self.__fetch(request))
+        else:
+            fetched = self.__fetch(request)
+        return fetched.then(lambda fetched: self._finishrequest(request, *fetched))
+
+    def __fetch(self, request):  # a Future for the (response, body) of request
+        in_background = self.in_background()
+        ready = self._resolved(None)
+        if in_background and request.endpoint != "account/rate_limit_status" and self.rate_limiter.needs_refresh():
+            ready = self.refresh_rate_limit()
+        future = Future()
+        ready.add_done_callback(lambda done: self.__schedule(request, future, in_background, 0.0))
+        return future
+
+    def _then(self, result, callback):
+        return result.then(callback)
+
+    def _resolved(self, value):
+        return resolved_future(value)
+
+    def _start(self, call):
+        return call()
+
+    def _finish(self, started):
+        if isinstance(started, Future):
+            return self.loop.run_until_complete(started)
+        return started  # e.g. the connection check, which always blocks
+
+    def __schedule(self, request, future, in_background, waited):  # waits for the rate limiter on the loop instead of blocking
+        limited = request.endpoint != "account/rate_limit_status"
+        if limited:
+            delay = self.rate_limiter.try_acquire(in_background)
+            if delay > 0:
+                if waited + delay > self.rate_limiter.max_wait:
+                    future.set_exception((RateLimitedError, RateLimitedError(max(delay, 1)), None))
+                else:
+                    self.loop.call_later(delay, lambda: self.__schedule(request, future, in_background, waited + delay))
+                return
+
+        started = time.time()
+
+        def finished(done):
+            if limited:
+                self.rate_limiter.release(in_background)
+            self.metrics.record(request.endpoint, time.time() - started, (done.exc_info is not None or None) and error_name(done.exc_info))
+            future.follow(done)
+        self.__send(request, 0, started).add_done_callback(finished)
+
+    def __send(self, request, attempt_count, started):  # StatusNet.__sendrequest's breaker and retry rules, with the waits moved onto the loop
+        host = urlparse.urlsplit(request.uri).netloc
+        breaker = self._breaker(host)
+        if breaker.retry_in() > 0:
+            return failed_future(CircuitOpenError(host, breaker.retry_in()))
+
+        def retry(error, retryable, retry_after=None):
+            breaker.record_failure()
+            delay = self.retry_policy.delay(attempt_count + 1, retry_after)
+            if (not retryable) or (attempt_count + 1 >= self.retry_policy.attempts) or (time.time() - started + delay > self.retry_policy.budget) or (breaker.retry_in() > 0):
+                raise error
+            self.metrics.record_retry(request.endpoint)
+            return self.loop.sleep(delay).then(lambda done: self.__send(request, attempt_count + 1, started))
+
+        def received(response):
+            self.rate_limiter.update_from_headers(response)
+            content = self.__decode(request.endpoint, response)
+            if response.status >= 400:
+                error = StatusNetError(response.status, self._errordetails(content))
+                if response.status < 500:  # the server is fine, it just didn't like the request
+                    breaker.record_success()
+                    raise error
+                return retry(error, (request.method == "GET") or (response.status == 503), response.getheader("retry-after"))
+            breaker.record_success()
+            return response, content
+
+        def errored(exc_info):
+            if isinstance(exc_info[1], httplib.BadStatusLine):
+                self.metrics.record_bad_status_line(request.endpoint)
+                return retry(StatusNetError(-1, "Could not successfully read any response. Please check that your connection is working."), request.method == "GET")
+            if isinstance(exc_info[1], ssl.CertificateError):
+                raise StatusNetError(-1, exc_info[1])
+            if isinstance(exc_info[1], (socket.error, httplib.HTTPException)):
+                return retry(StatusNetError(-1, exc_info[1]), request.method == "GET")
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        self.metrics.record_sent(request.endpoint, request_size(request.method, request.uri, request.body, request.headers))
+        return self.loop.fetch(request.method, request.uri, request.body, request.headers).then(received, errored)
+
+    def __decode(self, endpoint, response):
+        decoder = ContentDecoder(response.getheader("content-encoding"))
+        content = decoder.decode(response.body) + decoder.flush()
+        self.transfer_stats.record(endpoint, decoder.compressed_bytes, decoder.decompressed_bytes)
+        return content
+
+    def statuses_show_many(self, ids, known_ids=()):
+        ids = wanted_ids(ids, known_ids)
+        return gather([self.statuses_show(id) for id in ids]).then(lambda outcomes: hydrated_pairs(ids, outcomes))
+
+    def _streamrequest(self, request, store):  # the loop only hands over whole bodies, so the page arrives parsed and is iterated over afterwards
+        return self._dispatch(request).then(lambda notices: iter(store(notices)))
+
+    def users_show_many(self, user_ids):
+        return gather([self.users_show(user_id=user_id) for user_id in user_ids]).then(lambda outcomes: hydrated_pairs(user_ids, outcomes))
+
+    def account_verify_credentials(self):
+        return self._dispatch(self._preparerequest("account/verify_credentials")).then(self._storecurrentuser, lambda exc_info: False)
+
+    def lookup_ids(self, screen_names=(), nicknames=()):
+        lookups = [self.users_show(screen_name=name) for name in screen_names] + [self.statusnet_groups_show(nickname=name) for name in nicknames]
+
+        def split(outcomes):
+            ids = [profile['id'] for profile in outcome_results(outcomes)]
+            return ids[:len(screen_names)], ids[len(screen_names):]
+        return gather(lookups).then(split)
+
+    def refresh_rate_limit(self):
+        return self.account_rate_limit_status().then(self.rate_limiter.update_from_status, lambda exc_info: self.rate_limiter.update(None, None, None))
+
+    def help_test(self):
+        return self._dispatch(self._preparerequest("help/test")).then(lambda result: result, lambda exc_info: None)